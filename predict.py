@@ -1,5 +1,6 @@
 import sys
 import os
+import argparse
 import pandas as pd
 import warnings
 
@@ -13,8 +14,21 @@ from src.etl import cargar_datos, actualizar_datos, proximo_sorteo, nombre_dia_s
 from src.engines import LottoEngines
 from src.backtester import get_engine_weights
 
+# Búsqueda genética profunda para la predicción en vivo (modelo de islas en varios procesos)
+GA_WORKERS = int(os.environ.get('LOTTO_GA_WORKERS', os.cpu_count() or 1))
+GA_TIME_BUDGET = float(os.environ.get('LOTTO_GA_TIME_BUDGET', 30))
+GA_MAX_GENERATIONS = 2000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Predicción del próximo sorteo por consenso de engines")
+    parser.add_argument('--skip-lstm', action='store_true',
+                        help='Omite el engine LSTM (no se carga TensorFlow).')
+    return parser.parse_args()
+
 
 def main():
+    args = parse_args()
     print("⏳ Actualizando base de datos histórica...")
     try:
         msg = actualizar_datos()
@@ -42,10 +56,14 @@ def main():
     p_game, r_game = engines.engine_game_theory()
     p_markov, r_markov = engines.engine_markov()
     p_dec, r_dec = engines.engine_decades()
-    p_gen, r_gen = engines.engine_genetic()
+    p_gen, r_gen = engines.engine_genetic(
+        generations=GA_MAX_GENERATIONS, islands=max(GA_WORKERS, 2),
+        workers=GA_WORKERS, time_budget=GA_TIME_BUDGET,
+    )
     p_clust, r_clust = engines.engine_clusters()
     p_temp, r_temp = engines.engine_temporal_patterns()
-    p_lstm, r_lstm = engines.engine_lstm_engineer()
+    if not args.skip_lstm:
+        p_lstm, r_lstm = engines.engine_lstm_engineer()
 
     print("   ... Calculando pesos adaptativos por Backtesting...")
     weights = get_engine_weights(df, n_tests=20)
@@ -62,7 +80,8 @@ def main():
     print(f"🧬 Genético:     {p_gen} | R: {r_gen} | w: {weights.get('genetic', 0):.2f}")
     print(f"🗂️  Clústeres:   {p_clust} | R: {r_clust} | w: {weights.get('clusters', 0):.2f}")
     print(f"⏱️  Temporal:    {p_temp} | R: {r_temp} | w: {weights.get('temporal_patterns', 0):.2f}")
-    print(f"🧠 LSTM:         {p_lstm} | R: {r_lstm} | w: {weights.get('lstm_engineer', 1.0):.2f}")
+    if not args.skip_lstm:
+        print(f"🧠 LSTM:         {p_lstm} | R: {r_lstm} | w: {weights.get('lstm_engineer', 1.0):.2f}")
     print("----------------------------------------")
 
     # Acumular votos ponderados
@@ -70,8 +89,10 @@ def main():
     all_preds = [
         (p_stat, 'statistician'), (p_markov, 'markov'), (p_dec, 'decades'),
         (p_game, 'game_theory'), (p_gen, 'genetic'), (p_clust, 'clusters'),
-        (p_temp, 'temporal_patterns'), (p_lstm, 'lstm_engineer')
+        (p_temp, 'temporal_patterns')
     ]
+    if not args.skip_lstm:
+        all_preds.append((p_lstm, 'lstm_engineer'))
     for pred, name in all_preds:
         w = weights.get(name, 1)
         for ball in pred:
@@ -82,7 +103,9 @@ def main():
 
     # Reintegro: distribución ponderada
     import numpy as np
-    all_rs = [r_stat, r_markov, r_dec, r_game, r_gen, r_clust, r_temp, r_lstm]
+    all_rs = [r_stat, r_markov, r_dec, r_game, r_gen, r_clust, r_temp]
+    if not args.skip_lstm:
+        all_rs.append(r_lstm)
     r_counts = pd.Series(all_rs).value_counts()
     r_probs = r_counts / r_counts.sum()
     consenso_r = int(np.random.choice(r_probs.index, p=r_probs.values))
@@ -0,0 +1,81 @@
+import sys
+import os
+import argparse
+import time
+
+import numpy as np
+
+# Ensure src is in path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.engines import LottoEngines
+from src.history import DrawHistory
+
+DEFAULT_ENGINES = ['engine_decades', 'engine_temporal_patterns']
+
+# Rango útil de datetime64[ns]: se deja margen para no desbordar con históricos enormes
+_FECHA_FIN = np.datetime64('2025-12-31', 'ns')
+_SPAN_MAX_NS = np.int64(250 * 365 * 24 * 3600 * 10**9)
+_PASO_NS = np.int64(56 * 3600 * 10**9)  # ≈ 3 sorteos por semana
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark de latencia por llamada de los engines")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[4_000, 400_000],
+                        help='Tamaños de histórico sintético a medir. Por defecto: 4000 400000.')
+    parser.add_argument('--engines', type=str, default=','.join(DEFAULT_ENGINES),
+                        help='Engines separados por comas.')
+    parser.add_argument('--repeat', type=int, default=20,
+                        help='Llamadas medidas por engine (tras una de calentamiento).')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def historico_sintetico(n, seed=0):
+    """Genera n sorteos uniformes (6 de 49, complementario, reintegro) con fechas crecientes."""
+    rng = np.random.default_rng(seed)
+    balls = np.empty((n, 6), dtype=np.int8)
+    c = np.empty(n, dtype=np.int8)
+    for start in range(0, n, 100_000):
+        stop = min(start + 100_000, n)
+        orden = np.argsort(rng.random((stop - start, 49), dtype=np.float32), axis=1)
+        balls[start:stop] = np.sort(orden[:, :6], axis=1) + 1
+        c[start:stop] = orden[:, 6] + 1
+    r = rng.integers(0, 10, size=n, dtype=np.int8)
+
+    # Con históricos muy largos se acorta el paso para seguir dentro de datetime64[ns]
+    paso = min(_PASO_NS, _SPAN_MAX_NS // max(n, 1))
+    fechas = _FECHA_FIN.astype(np.int64) - paso * np.arange(n - 1, -1, -1, dtype=np.int64)
+    return DrawHistory(balls, c=c, r=r, fechas=fechas)
+
+
+def medir(engines, name, repeat):
+    """Devuelve (primera llamada, mediana, p95) en ms."""
+    method = getattr(engines, name)
+    t0 = time.perf_counter()
+    method()
+    cold = time.perf_counter() - t0
+
+    tiempos = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        method()
+        tiempos.append(time.perf_counter() - t0)
+    tiempos = np.array(tiempos) * 1000
+    return cold * 1000, float(np.median(tiempos)), float(np.percentile(tiempos, 95))
+
+
+def main():
+    args = parse_args()
+    names = [e.strip() for e in args.engines.split(',') if e.strip()]
+
+    print(f"{'sorteos':>9} {'engine':<28} {'1ª (ms)':>10} {'mediana':>10} {'p95':>10}")
+    for n in args.sizes:
+        history = historico_sintetico(n, seed=args.seed)
+        engines = LottoEngines(history)
+        for name in names:
+            cold, mediana, p95 = medir(engines, name, args.repeat)
+            print(f"{n:>9} {name:<28} {cold:>10.1f} {mediana:>10.2f} {p95:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,7 @@ import time
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from src.etl import cargar_datos
 from src.engines import LottoEngines
+from src.history import DrawHistory
 
 RESULTS_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'simulation_results.csv'))
 
@@ -18,7 +19,9 @@ def parse_args():
     parser.add_argument('--end-index', type=int, default=None, 
                         help='Índice del sorteo en el que terminar. Si no se especifica, procesa hasta el final.')
     parser.add_argument('--include-slow', action='store_true', 
-                        help='Incluir motores lentos (LSTM, Genético).')
+                        help='Incluir motores lentos (LSTM).')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Semilla para resultados reproducibles (cada sorteo usa seed + índice).')
     return parser.parse_args()
 
 def main():
@@ -30,19 +33,22 @@ def main():
         return
 
     total_draws = len(df)
+    history = DrawHistory.from_dataframe(df)
     print(f"✅ Histórico cargado. Total de sorteos: {total_draws}")
 
     engines_to_test = [
         'engine_statistician',
         'engine_game_theory',
         'engine_markov',
+        'engine_markov_high_order',
         'engine_decades',
         'engine_clusters',
+        'engine_genetic',
         'engine_temporal_patterns',
     ]
 
     if args.include_slow:
-        engines_to_test.extend(['engine_lstm_engineer', 'engine_genetic'])
+        engines_to_test.append('engine_lstm_engineer')
 
     print(f"Motores a evaluar: {', '.join([e.replace('engine_', '') for e in engines_to_test])}")
 
@@ -77,12 +83,12 @@ def main():
         real_r = int(real_row['r'])
         draw_date = real_row['fecha'].strftime('%Y-%m-%d') if pd.notnull(real_row['fecha']) else ''
 
-        # Cortar el dataframe hasta el momento justo antes de este sorteo
-        df_train = df.iloc[:i].copy()
+        # Vista del histórico hasta el momento justo antes de este sorteo (sin copia)
+        history_train = history.prefix(i)
         
-        engines = LottoEngines(df_train)
+        engines = LottoEngines(history_train, seed=None if args.seed is None else args.seed + i)
         
-        print(f"Evaluando Sorteo {i}/{total_draws-1} ({draw_date}) con {len(df_train)} histórico...", end='', flush=True)
+        print(f"Evaluando Sorteo {i}/{total_draws-1} ({draw_date}) con {len(history_train)} histórico...", end='', flush=True)
         start_time = time.time()
         
         draw_results = []
@@ -92,6 +98,8 @@ def main():
                 # handle args for genetic if possible, but it has defaults
                 if engine_name == 'engine_lstm_engineer':
                      pred_nums, pred_r = engine_fn(force_train=False) # Don't retrain in every step!
+                elif engine_name == 'engine_temporal_patterns' and pd.notnull(real_row['fecha']):
+                     pred_nums, pred_r = engine_fn(target_dow=real_row['fecha'].weekday())
                 else:
                      pred_nums, pred_r = engine_fn()
                 
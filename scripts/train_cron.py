@@ -1,5 +1,6 @@
 import sys
 import os
+import time
 from datetime import datetime
 import csv
 
@@ -9,6 +10,8 @@ sys.path.append(BASE_DIR)
 
 from src.etl import actualizar_datos, cargar_datos
 from src.engines import LottoEngines, PREDICTIONS_PATH
+from src.lstm import (FEATURES_PATH, PARITY_TOL, TF_AVAILABLE, feature_matrix, update_feature_store,
+                      update_model, verify_numpy_export)
 
 def main():
     print(f"🔄 [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Iniciando Cron: Actualización y Entrenamiento")
@@ -29,10 +32,27 @@ def main():
             return
 
         engines = LottoEngines(df)
-        print("🧠 Re-entrenando red neuronal (BiLSTM)...")
-        # Forzar entrenamiento para actualizar pesos con datos nuevos
-        nums, r = engines.engine_lstm_engineer(force_train=True)
-        print(f"✅ Modelo guardado en models/lotto_lstm.keras")
+        nuevas = update_feature_store(engines.history)
+        print(f"🧮 Features LSTM: {nuevas} filas nuevas en {os.path.relpath(FEATURES_PATH, BASE_DIR)}")
+        if TF_AVAILABLE:
+            print("🧠 Actualizando red neuronal (BiLSTM)...")
+            # Fine-tuning con los sorteos nuevos; reentrenamiento completo por calendario o deriva
+            t0 = time.perf_counter()
+            model, modo, motivo = update_model(engines.history)
+            detalle = f" ({motivo})" if motivo else ""
+            print(f"✅ Modelo {modo}{detalle} en {time.perf_counter() - t0:.1f}s → models/lotto_lstm.keras")
+            # Artefacto de inferencia NumPy (exportado al guardar): paridad con Keras.
+            # Un fallo aquí no debe impedir guardar las predicciones
+            try:
+                error = verify_numpy_export(model, feature_matrix(engines.history))
+                if error is None:
+                    print("ℹ️ Paridad NumPy/Keras omitida: arquitectura no exportable, se usará Keras")
+                else:
+                    estado = "OK" if error <= PARITY_TOL else "FALLO, se usará Keras"
+                    print(f"🧪 Paridad NumPy/Keras: {error:.2e} ({estado}) → models/lotto_lstm.npz")
+            except Exception as e:
+                print(f"⚠️ Paridad NumPy/Keras no comprobada ({e}), se usará Keras si hace falta")
+        nums, r = engines.engine_lstm_engineer()
         print(f"🔮 Predicción LSTM: {nums} R:{r}")
         
         # 3. Guardar predicciones en predictions.csv
@@ -12,6 +12,7 @@ import plotly.express as px
 import plotly.graph_objects as go
 from src.etl import actualizar_datos, cargar_datos, descargar_historico_completo, proximo_sorteo, nombre_dia_sorteo
 from src.engines import LottoEngines, MODEL_PATH, TF_AVAILABLE
+from src.lstm_numpy import NUMPY_MODEL_PATH
 from src.backtester import get_engine_weights
 import time
 from datetime import datetime
@@ -216,7 +217,7 @@ tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8, tab9, tab10, tab11, tab12 = st.t
 with tab1:
     st.header("Red Neuronal BiLSTM Profunda")
     st.write("Lookback de 60 sorteos · 2 capas BiLSTM · BatchNorm · Features enriquecidas · LR Scheduling.")
-    if not TF_AVAILABLE:
+    if not TF_AVAILABLE and not os.path.exists(NUMPY_MODEL_PATH):
         st.warning("⚠️ **TensorFlow no disponible.** Se usará un motor de contingencia aleatorio.")
     
     col_run, col_info = st.columns([1, 2])
@@ -520,8 +521,8 @@ with tab12:
     # ── Frecuencia de números ──
     st.subheader("Frecuencia de aparición de cada número")
     ball_cols = ['n1', 'n2', 'n3', 'n4', 'n5', 'n6']
-    all_balls = df[ball_cols].stack()
-    freq_counts = all_balls.value_counts().sort_index()
+    freq_counts = pd.Series(engines.history.frequencies(), index=range(1, 50))
+    freq_ranking = freq_counts.sort_values(ascending=False, kind='stable')
     freq_df = pd.DataFrame({'Número': freq_counts.index, 'Apariciones': freq_counts.values})
 
     fig_freq = px.bar(
@@ -536,14 +537,14 @@ with tab12:
     col_top, col_bot = st.columns(2)
     with col_top:
         st.markdown("**🔥 Top 10 más frecuentes**")
-        top10 = all_balls.value_counts().head(10)
+        top10 = freq_ranking.head(10)
         st.dataframe(
             pd.DataFrame({'Número': top10.index, 'Apariciones': top10.values}),
             hide_index=True, use_container_width=True
         )
     with col_bot:
         st.markdown("**❄️ Top 10 menos frecuentes**")
-        bot10 = all_balls.value_counts().tail(10).sort_values()
+        bot10 = freq_ranking.tail(10).sort_values()
         st.dataframe(
             pd.DataFrame({'Número': bot10.index, 'Apariciones': bot10.values}),
             hide_index=True, use_container_width=True
@@ -553,8 +554,7 @@ with tab12:
 
     # ── Distribución del Reintegro (solo post-2004) ──
     st.subheader("Distribución del Reintegro (solo datos fiables post-2004)")
-    df_post2004 = df[pd.to_datetime(df['fecha']) >= '2004-01-01']
-    r_counts = df_post2004['r'].value_counts().sort_index()
+    r_counts = pd.Series(engines.history.reintegro_frequencies(), index=range(10))
     fig_r = px.bar(
         x=r_counts.index, y=r_counts.values,
         labels={'x': 'Reintegro', 'y': 'Apariciones'},
@@ -568,7 +568,7 @@ with tab12:
 
     # ── Heatmap de co-ocurrencia ──
     st.subheader("Heatmap de Co-ocurrencia (Top 20 números)")
-    top20_nums = all_balls.value_counts().head(20).index.tolist()
+    top20_nums = freq_ranking.head(20).index.tolist()
     cooc_matrix = pd.DataFrame(0, index=top20_nums, columns=top20_nums)
     for _, row in df[ball_cols].iterrows():
         draw = [int(v) for v in row.values if int(v) in top20_nums]
@@ -6,9 +6,10 @@ Mide la precisión histórica de cada engine contra sorteos reales pasados.
 import pandas as pd
 import numpy as np
 from src.engines import LottoEngines
+from src.history import DrawHistory
 
 
-def backtest_engine(df: pd.DataFrame, engine_name: str, n_tests: int = 50) -> dict:
+def backtest_engine(df: pd.DataFrame, engine_name: str, n_tests: int = 50, seed=None) -> dict:
     """
     Ejecuta un engine contra los últimos n_tests sorteos reales del histórico.
 
@@ -18,6 +19,7 @@ def backtest_engine(df: pd.DataFrame, engine_name: str, n_tests: int = 50) -> di
                       Opciones: 'engine_lstm_engineer', 'engine_statistician',
                                 'engine_game_theory', 'engine_markov', 'engine_decades'
         n_tests     : Cuántos sorteos históricos usar como test (máx recomendado: 100).
+        seed        : Semilla para que el backtest sea reproducible (None = aleatorio).
 
     Retorna:
         dict con claves:
@@ -33,19 +35,26 @@ def backtest_engine(df: pd.DataFrame, engine_name: str, n_tests: int = 50) -> di
     matches_dist = []
     hits = {3: 0, 4: 0, 5: 0, 6: 0}
     errors = 0
+    history = DrawHistory.from_dataframe(df.reset_index(drop=True))
+    rng = np.random.default_rng(seed)
+    weekdays = history.weekdays() if history.has_dates else None
 
     for i in range(n_tests, 0, -1):
-        # Datos de entrenamiento: todo excepto los últimos i sorteos
-        df_train = df.iloc[:-i].copy()
+        # Datos de entrenamiento: todo excepto los últimos i sorteos (vista sin copia)
+        history_train = history.prefix(len(history) - i)
         real_row = df.iloc[-i]
         real_draw = set(
             int(real_row[col]) for col in ['n1', 'n2', 'n3', 'n4', 'n5', 'n6']
         )
 
         try:
-            engines = LottoEngines(df_train)
+            engines = LottoEngines(history_train)
             engine_fn = getattr(engines, engine_name)
-            pred, _ = engine_fn()
+            if engine_name == 'engine_temporal_patterns' and weekdays is not None:
+                # El día del sorteo evaluado, no el del próximo sorteo real
+                pred, _ = engine_fn(target_dow=int(weekdays[-i]), rng=rng)
+            else:
+                pred, _ = engine_fn(rng=rng)
             pred_set = set(pred)
             n_matches = len(pred_set & real_draw)
             matches_dist.append(n_matches)
@@ -84,6 +93,7 @@ def backtest_all_engines(df: pd.DataFrame, n_tests: int = 30, skip_slow: bool =
         'engine_statistician',
         'engine_game_theory',
         'engine_markov',
+        'engine_markov_high_order',
         'engine_decades',
         'engine_clusters',
         'engine_genetic',
@@ -0,0 +1,88 @@
+# src/clustering.py
+"""
+Clústeres de sorteos para engine_clusters, con el modelo en caché por versión del dataset.
+
+El modelo (MiniBatchKMeans sobre las 6 bolas de cada sorteo) se ajusta una sola vez
+por histórico. Cuando se pide un histórico que extiende a uno ya ajustado (el paso
+siguiente de un walk-forward, o la app tras añadir un sorteo), no se reajusta: los
+sorteos nuevos se asignan con `predict` y solo cada `refit_every` sorteos nuevos se
+actualizan los centroides con `partial_fit` y se reasignan todas las etiquetas.
+Nunca se reutiliza un modelo ajustado con sorteos posteriores a los del histórico
+pedido (no hay fuga de información hacia el pasado en backtesting).
+"""
+import copy
+import importlib.util
+import threading
+
+import numpy as np
+
+# scikit-learn se importa al ajustar el primer modelo, no al importar el módulo
+CLUSTERING_AVAILABLE = importlib.util.find_spec('sklearn') is not None
+
+N_CLUSTERS = 10
+CLUSTER_REFIT_EVERY = 50       # Sorteos nuevos entre dos partial_fit
+CLUSTER_BATCH_SIZE = 1024
+CLUSTER_CACHE_SIZE = 8
+
+_clusters_lock = threading.Lock()
+_clusters_cache = {}
+
+
+class DrawClusters:
+    """Modelo ajustado sobre los primeros `n` sorteos y la etiqueta de clúster de cada uno."""
+
+    def __init__(self, model, labels, n_fit):
+        self.model = model
+        self.labels = labels
+        self.n_fit = n_fit  # Sorteos incorporados a los centroides (fit + partial_fit)
+
+    @property
+    def n(self):
+        return len(self.labels)
+
+    @classmethod
+    def fit(cls, balls, n_clusters=N_CLUSTERS):
+        from sklearn.cluster import MiniBatchKMeans
+
+        X = np.asarray(balls, dtype=float)
+        model = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3,
+                                batch_size=CLUSTER_BATCH_SIZE)
+        labels = model.fit_predict(X)
+        return cls(model, labels, len(X))
+
+    def extend(self, balls, refit_every=CLUSTER_REFIT_EVERY):
+        """Copia ampliada hasta len(balls) sorteos (los primeros `n` deben ser los ya vistos)."""
+        X = np.asarray(balls, dtype=float)
+        model, n_fit = self.model, self.n_fit
+        if len(X) - n_fit >= refit_every:
+            model = copy.deepcopy(model)
+            model.partial_fit(X[n_fit:])
+            return DrawClusters(model, model.predict(X), len(X))
+        labels = np.concatenate([self.labels, model.predict(X[self.n:])])
+        # El modelo no cambia entre refits: se comparte sin copiar
+        return DrawClusters(model, labels, n_fit)
+
+
+def draw_clusters(history, n_clusters=N_CLUSTERS, refit_every=CLUSTER_REFIT_EVERY):
+    """
+    DrawClusters de `history`. Se reutiliza el de la misma versión del dataset; si no,
+    se amplía el del prefijo más largo en caché y, en último caso, se ajusta de cero.
+    """
+    key = (history.version(), n_clusters, refit_every)
+    with _clusters_lock:
+        clusters = _clusters_cache.get(key)
+        if clusters is None:
+            base = None
+            for (version, k, every), cached in _clusters_cache.items():
+                if (k, every) != (n_clusters, refit_every) or version[0] >= len(history):
+                    continue
+                if (base is None or cached.n > base.n) and history.prefix(version[0]).version() == version:
+                    base = cached
+            if base is not None:
+                clusters = base.extend(history.balls, refit_every)
+            else:
+                clusters = DrawClusters.fit(history.balls, n_clusters)
+            while len(_clusters_cache) >= CLUSTER_CACHE_SIZE:
+                _clusters_cache.pop(next(iter(_clusters_cache)))
+            _clusters_cache[key] = clusters
+        return clusters
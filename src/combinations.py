@@ -0,0 +1,316 @@
+# src/combinations.py
+"""
+Enumeración del espacio completo de combinaciones 6/49 (13.983.816), el índice
+precalculado de combinaciones válidas para engine_game_theory y la búsqueda exacta
+del top-K de combinaciones bajo un vector de scores por bola.
+
+Las combinaciones se generan en orden colexicográfico por programación dinámica:
+las combinaciones de k números con máximo m son las C(m-1, k-1) primeras de tamaño
+k-1 (todas con números < m) más la columna m. Así el espacio se recorre en bloques
+de tamaño fijo (uno por bola mayor, a lo sumo C(48, 5) = 1.712.304 filas) sin
+materializarlo entero. En orden colex, las máscaras de 49 bits quedan además
+ordenadas de forma ascendente.
+"""
+import os
+import threading
+import zlib
+from functools import lru_cache
+from itertools import combinations
+from math import comb
+
+import numpy as np
+
+from src.history import balls_to_masks, masks_to_balls
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INDEX_DIR = os.path.join(BASE_DIR, 'data', 'cache')
+
+N_COMBINATIONS = comb(49, 6)
+
+# Reglas "anti-humanas" de engine_game_theory
+GAME_THEORY_SUM_RANGE = (115, 185)
+GAME_THEORY_MAX_CONSECUTIVES = 2
+GAME_THEORY_MAX_LOW = 4          # Como mucho 4 números ≤ 31 (fechas)
+GAME_THEORY_SPLIT = 24           # Al menos un número ≤ 24 y otro > 24
+GAME_THEORY_MAX_POPULAR = 2
+POPULAR_NUMBERS = frozenset(
+    {7, 13, 14, 21, 28, 35, 42, 49}  # Múltiplos de 7 (y el 13)
+    | {1, 2, 3, 4, 5, 6}             # Secuencias bajas
+    | {11, 22, 33, 44}               # Repetidos
+)
+
+_index_lock = threading.Lock()
+_index = None
+
+
+@lru_cache(maxsize=None)
+def _colex_table(k):
+    """Todas las combinaciones de k números (1-49) en orden colex, como int8 (C(49, k), k)."""
+    if k == 1:
+        return np.arange(1, 50, dtype=np.int8)[:, None]
+    prev = _colex_table(k - 1)
+    blocks = [_extend(prev, m, k) for m in range(k, 50)]
+    return np.concatenate(blocks)
+
+
+def _extend(prev, m, k):
+    """Combinaciones de k números con máximo m: prefijos de tamaño k-1 con números < m, más m."""
+    rows = comb(m - 1, k - 1)
+    block = np.empty((rows, k), dtype=np.int8)
+    block[:, :-1] = prev[:rows]
+    block[:, -1] = m
+    return block
+
+
+def combination_block(m):
+    """Las C(m-1, 5) combinaciones con bola mayor m (6..49), en orden colex, como (K, 6) int8."""
+    return _extend(_colex_table(5), m, 6)
+
+
+def iter_blocks():
+    """
+    Recorre las 13.983.816 combinaciones en orden colex, en bloques (K, 6) int8 con
+    filas ordenadas: un bloque por bola mayor (6..49). Memoria acotada al bloque mayor.
+    """
+    for m in range(6, 50):
+        yield combination_block(m)
+
+
+def game_theory_filter(balls):
+    """Máscara booleana de las filas (K, 6), ordenadas, que cumplen las reglas de engine_game_theory."""
+    balls = np.asarray(balls, dtype=np.int16)
+    s = balls.sum(axis=1)
+    consecutives = (np.diff(balls, axis=1) == 1).sum(axis=1)
+    low = (balls <= 31).sum(axis=1)
+    popular = np.isin(balls, list(POPULAR_NUMBERS)).sum(axis=1)
+    return (
+        (s >= GAME_THEORY_SUM_RANGE[0]) & (s <= GAME_THEORY_SUM_RANGE[1])
+        & (consecutives <= GAME_THEORY_MAX_CONSECUTIVES)
+        & (low <= GAME_THEORY_MAX_LOW)
+        & (balls[:, 0] <= GAME_THEORY_SPLIT) & (balls[:, -1] > GAME_THEORY_SPLIT)
+        & (popular <= GAME_THEORY_MAX_POPULAR)
+    )
+
+
+@lru_cache(maxsize=None)
+def _game_theory_prefix_stats():
+    """Estadísticos de las reglas sobre la tabla colex de 5 (prefijos de todos los bloques)."""
+    prefix = _colex_table(5).astype(np.int16)
+    return {
+        'sum': prefix.sum(axis=1),
+        'first': prefix[:, 0],
+        'last': prefix[:, -1],
+        'consecutives': (np.diff(prefix, axis=1) == 1).sum(axis=1),
+        'low': (prefix <= 31).sum(axis=1),
+        'popular': np.isin(prefix, list(POPULAR_NUMBERS)).sum(axis=1),
+    }
+
+
+def game_theory_block_filter(m):
+    """
+    game_theory_filter para combination_block(m), evaluado de forma incremental: cada
+    fila es un prefijo de 5 (estadísticos precalculados) más la bola mayor m.
+    """
+    rows = comb(m - 1, 5)
+    st = {k: v[:rows] for k, v in _game_theory_prefix_stats().items()}
+    s = st['sum'] + m
+    consecutives = st['consecutives'] + (st['last'] == m - 1)
+    low = st['low'] + (m <= 31)
+    popular = st['popular'] + (m in POPULAR_NUMBERS)
+    return (
+        (s >= GAME_THEORY_SUM_RANGE[0]) & (s <= GAME_THEORY_SUM_RANGE[1])
+        & (consecutives <= GAME_THEORY_MAX_CONSECUTIVES)
+        & (low <= GAME_THEORY_MAX_LOW)
+        & (st['first'] <= GAME_THEORY_SPLIT) & (m > GAME_THEORY_SPLIT)
+        & (popular <= GAME_THEORY_MAX_POPULAR)
+    )
+
+
+def game_theory_signature():
+    """Firma (CRC32) de las reglas de engine_game_theory, para invalidar cachés si cambian."""
+    reglas = repr((GAME_THEORY_SUM_RANGE, GAME_THEORY_MAX_CONSECUTIVES, GAME_THEORY_MAX_LOW,
+                   GAME_THEORY_SPLIT, GAME_THEORY_MAX_POPULAR, sorted(POPULAR_NUMBERS)))
+    return zlib.crc32(reglas.encode())
+
+
+def _index_path():
+    """Ruta del índice; el nombre incluye la firma de las reglas."""
+    return os.path.join(INDEX_DIR, f'combinaciones_game_theory_{game_theory_signature():08x}.npy')
+
+
+def build_game_theory_index():
+    """Enumera el espacio completo y devuelve las máscaras uint64 válidas, en orden ascendente."""
+    parts = []
+    for m in range(6, 50):
+        block = combination_block(m)
+        parts.append(balls_to_masks(block[game_theory_block_filter(m)]))
+    return np.concatenate(parts)
+
+
+def game_theory_index():
+    """
+    Índice de combinaciones válidas (máscaras uint64 ordenadas, solo lectura).
+    Se construye una vez y se guarda en data/cache; después se abre con mmap y se
+    comparte en todo el proceso.
+    """
+    global _index
+    with _index_lock:
+        if _index is not None:
+            return _index
+        path = _index_path()
+        try:
+            _index = np.load(path, mmap_mode='r')
+            return _index
+        except (OSError, ValueError):
+            pass
+
+        masks = build_game_theory_index()
+        try:
+            os.makedirs(INDEX_DIR, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp.npy"
+            np.save(tmp, masks)
+            os.replace(tmp, path)
+            _index = np.load(path, mmap_mode='r')
+        except OSError:
+            # Sin disco escribible: se usa el índice en memoria
+            masks.flags.writeable = False
+            _index = masks
+        return _index
+
+
+def sample_game_theory(n, rng):
+    """n combinaciones válidas distintas, uniformes sobre el índice, como array (n, 6) int8."""
+    index = game_theory_index()
+    picks = rng.choice(len(index), size=min(n, len(index)), replace=False)
+    return masks_to_balls(index[picks])
+
+
+# ── Top-K exacto bajo un objetivo por combinación ──
+
+_PAIRS_6 = list(combinations(range(6), 2))
+_PAIRS_4 = list(combinations(range(4), 2))
+_POPCOUNT_7 = np.array([bin(i).count('1') for i in range(128)], dtype=np.int8)
+
+
+def _decade_masks(balls):
+    """Máscara de 7 bits con las décadas (1-7, 8-14, ..., 43-49) presentes en cada fila."""
+    bits = np.left_shift(1, (np.asarray(balls, dtype=np.int16) - 1) // 7).astype(np.uint8)
+    return np.bitwise_or.reduce(bits, axis=1)
+
+
+def combination_scores(balls, ball_scores, pair_scores=None, sum_range=None,
+                       sum_penalty=0.0, decade_bonus=0.0):
+    """
+    Objetivo de cada combinación (K, 6):
+        Σ ball_scores[b] + Σ_pares pair_scores[b_i, b_j]
+        - sum_penalty si la suma queda fuera de `sum_range`
+        + decade_bonus · nº de décadas distintas.
+    `pair_scores` es una matriz simétrica (49, 49); cada par cuenta una vez.
+    """
+    idx = np.asarray(balls, dtype=np.intp) - 1
+    score = np.asarray(ball_scores, dtype=float)[idx].sum(axis=1)
+    if pair_scores is not None:
+        for i, j in _PAIRS_6:
+            score += pair_scores[idx[:, i], idx[:, j]]
+    if sum_range is not None:
+        s = idx.sum(axis=1) + 6
+        score -= sum_penalty * ((s < sum_range[0]) | (s > sum_range[1]))
+    if decade_bonus:
+        score += decade_bonus * _POPCOUNT_7[_decade_masks(balls)]
+    return score
+
+
+@lru_cache(maxsize=None)
+def _leaf_table():
+    """
+    Las C(49, 4) combinaciones de 4 reflejadas (x → 50 - x): las C(49 - b, 4) primeras
+    filas son exactamente las que tienen todos sus números > b.
+    """
+    leaves = (50 - _colex_table(4)).astype(np.int16)
+    leaves.flags.writeable = False
+    return leaves
+
+
+def top_k_combinations(ball_scores, k=10, pair_scores=None, sum_range=None,
+                       sum_penalty=0.0, decade_bonus=0.0):
+    """
+    Las k combinaciones de mayor `combination_scores`, exactas, como (balls (k, 6), scores (k,))
+    de mejor a peor.
+
+    Ramificación y poda sobre los 990 prefijos (a, b) de las dos bolas menores: cada
+    prefijo se acota por su parte fija + el máximo de la parte interna de las hojas
+    (4 bolas > b, precalculado) + los 4 mejores términos cruzados con a y b + la mejor
+    bonificación posible. Los prefijos se visitan de mayor a menor cota y sus hojas se
+    evalúan en bloque; la búsqueda termina cuando la cota no supera al k-ésimo mejor.
+    """
+    s = np.asarray(ball_scores, dtype=float)
+    pairs = None
+    if pair_scores is not None:
+        pairs = np.array(pair_scores, dtype=float)
+        np.fill_diagonal(pairs, 0.0)
+
+    leaves = _leaf_table()
+    leaf_idx = leaves.astype(np.intp) - 1
+    leaf_score = s[leaf_idx].sum(axis=1)
+    if pairs is not None:
+        for i, j in _PAIRS_4:
+            leaf_score += pairs[leaf_idx[:, i], leaf_idx[:, j]]
+    leaf_best = np.maximum.accumulate(leaf_score)
+    leaf_sum = leaves.sum(axis=1)
+    leaf_decades = _decade_masks(leaves)
+
+    # Prefijos (a, b), 0-based, con al menos 4 números por encima de b
+    a_idx, b_idx = np.triu_indices(49, k=1)
+    keep = b_idx <= 44
+    a_idx, b_idx = a_idx[keep], b_idx[keep]
+    n_leaves = np.array([comb(48 - b, 4) for b in range(49)])[b_idx]
+
+    base = s[a_idx] + s[b_idx]
+    cross = np.zeros((len(a_idx), 49))
+    if pairs is not None:
+        base += pairs[a_idx, b_idx]
+        cross = pairs[a_idx] + pairs[b_idx]
+    # Mejores 4 términos cruzados entre los candidatos > b
+    masked = np.where(np.arange(49) > b_idx[:, None], cross, -np.inf)
+    cross_best = -np.partition(-masked, 3, axis=1)[:, :4].sum(axis=1)
+
+    bonus_best = max(decade_bonus * 6, decade_bonus)
+    penalty_best = 0.0 if sum_range is None else max(-sum_penalty, 0.0)
+    bound = base + leaf_best[n_leaves - 1] + cross_best + bonus_best + penalty_best
+
+    best_balls = np.empty((0, 6), dtype=np.int8)
+    best_scores = np.empty(0)
+    threshold = -np.inf
+    for p in np.argsort(-bound, kind='stable'):
+        if len(best_scores) >= k and bound[p] <= threshold:
+            break
+        a, b, n = a_idx[p], b_idx[p], n_leaves[p]
+        score = base[p] + leaf_score[:n]
+        if pairs is not None:
+            score = score + cross[p][leaf_idx[:n]].sum(axis=1)
+        if sum_range is not None:
+            total = leaf_sum[:n] + (a + b + 2)
+            score -= sum_penalty * ((total < sum_range[0]) | (total > sum_range[1]))
+        if decade_bonus:
+            prefix_decades = (1 << (a // 7)) | (1 << (b // 7))
+            score += decade_bonus * _POPCOUNT_7[leaf_decades[:n] | prefix_decades]
+
+        cand = np.flatnonzero(score > threshold) if len(best_scores) >= k else np.arange(n)
+        if len(cand) > k:
+            cand = cand[np.argpartition(-score[cand], k - 1)[:k]]
+        if not len(cand):
+            continue
+        rows = np.empty((len(cand), 6), dtype=np.int8)
+        rows[:, 0], rows[:, 1] = a + 1, b + 1
+        rows[:, 2:] = leaves[cand][:, ::-1]
+
+        best_balls = np.concatenate([best_balls, rows])
+        best_scores = np.concatenate([best_scores, score[cand]])
+        if len(best_scores) > k:
+            top = np.argpartition(-best_scores, k - 1)[:k]
+            best_balls, best_scores = best_balls[top], best_scores[top]
+        if len(best_scores) >= k:
+            threshold = best_scores.min()
+
+    order = np.argsort(-best_scores, kind='stable')
+    return best_balls[order], best_scores[order]
@@ -1,305 +1,326 @@
 # src/engines.py
-import pandas as pd
 import numpy as np
-import random
 import os
-from datetime import datetime, timedelta
-from collections import Counter
-
-# TensorFlow es opcional — si no está disponible los engines sin IA siguen funcionando
-try:
-    import tensorflow as tf
-    from tensorflow.keras.models import Sequential, load_model
-    from tensorflow.keras.layers import LSTM, Dense, Dropout, Bidirectional, BatchNormalization
-    from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
-    from tensorflow.keras.optimizers import Adam
-    TF_AVAILABLE = True
-except ImportError:
-    TF_AVAILABLE = False
-
-try:
-    from sklearn.cluster import KMeans
-except ImportError:
-    KMeans = None
+import threading
+import zlib
+
+from src.history import DrawHistory, balls_to_onehot
+from src.genetic import SUM_RANGE, evolve, evolve_islands, random_population
+from src.clustering import CLUSTER_REFIT_EVERY, CLUSTERING_AVAILABLE, draw_clusters
+from src.combinations import sample_game_theory, top_k_combinations
+from src.expected_value import top_ev_tickets
+from src.lstm import (LOOKBACK, MODEL_PATH, TF_AVAILABLE, feature_matrix, feature_window,
+                      predict_next, resident_model, train_model)
+from src.lstm_numpy import resident_numpy_model
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-MODEL_PATH = os.path.join(BASE_DIR, 'models', 'lotto_lstm.keras')
 PREDICTIONS_PATH = os.path.join(BASE_DIR, 'data', 'predictions.csv')
 
-# Fecha a partir de la cual el reintegro es fiable en La Primitiva
-REINTEGRO_VALID_FROM = '2004-01-01'
+# Tamaño del top por valor esperado entre el que elige engine_game_theory(top_ev=True)
+GAME_THEORY_TOP_K = 1000
+
+# Distribución del reintegro por versión del dataset (compartida por todas las instancias)
+REINTEGRO_CACHE_SIZE = 8
+_reintegro_lock = threading.Lock()
+_reintegro_cache = {}
+
+
+def reintegro_probabilities(history):
+    """
+    Distribución (10,) del reintegro: frecuencia reciente (últimos 50, peso 55%) +
+    histórica (25%) + retraso desde la última aparición (20%), cada una normalizada
+    a [0, 1], con un floor de 0.05. Solo cuenta los sorteos con reintegro fiable
+    (pre-2004 el reintegro no existía y está guardado como 0 falso).
+    """
+    if len(history) - history.reintegro_start() < 10:
+        return np.full(10, 0.1)
+
+    r_reciente = history.reintegro_frequencies(last=50).astype(float)
+    r_historico = history.reintegro_frequencies().astype(float)
+
+    # Retraso: sorteos (con reintegro fiable) desde la última aparición; máximo si nunca apareció
+    r_lag = history.stats().r_lag().astype(float)
+
+    def normalize(s):
+        s_min, s_max = s.min(), s.max()
+        if s_max == s_min:
+            return np.full(len(s), 1.0 / len(s))
+        return (s - s_min) / (s_max - s_min)
+
+    combined = normalize(r_reciente) * 0.55 + normalize(r_historico) * 0.25 + normalize(r_lag) * 0.20
+    # Floor mínimo para que ningún reintegro tenga probabilidad 0
+    combined = combined + 0.05
+    probabilities = combined / combined.sum()
+    probabilities.setflags(write=False)  # Compartida entre instancias vía la caché
+    return probabilities
 
 
 class LottoEngines:
-    def __init__(self, df):
-        self.df = df.reset_index(drop=True)  # Garantizar índices 0-based siempre
+    def __init__(self, data, seed=None):
+        """
+        `data` puede ser un DrawHistory o el DataFrame de cargar_datos (se convierte una vez).
+
+        Los engines no modifican el histórico ni usan el estado global de `random` /
+        `np.random`: cada llamada recibe su propio `numpy.random.Generator` (argumento
+        `rng`) o lo deriva de `seed`, así que una misma instancia puede usarse desde
+        varios hilos. Con `seed` fijo, cada engine es reproducible llamada a llamada.
+        """
+        if isinstance(data, DrawHistory):
+            self.history = data
+        else:
+            self.history = DrawHistory.from_dataframe(data.reset_index(drop=True))
         self.ball_cols = ['n1', 'n2', 'n3', 'n4', 'n5', 'n6']
+        self.seed = seed
+        self._df = None
+        self._stats = None
+        self._reintegro_p = None
+
+    def _rng(self, rng, label):
+        """
+        Resuelve el generador de una llamada: un Generator se usa tal cual; un entero
+        (o `self.seed`) se combina con el nombre del engine para que engines distintos
+        no compartan secuencia; sin semilla se usa entropía del sistema.
+        """
+        if isinstance(rng, np.random.Generator):
+            return rng
+        seed = self.seed if rng is None else rng
+        if seed is None:
+            return np.random.default_rng()
+        return np.random.default_rng(
+            np.random.SeedSequence(seed, spawn_key=(zlib.crc32(label.encode()),))
+        )
+
+    @property
+    def stats(self):
+        """Estadísticos suficientes (frecuencias, lags, gaps) del histórico, calculados una vez."""
+        if self._stats is None:
+            self._stats = self.history.stats()
+        return self._stats
+
+    @property
+    def df(self):
+        """Vista tabular del histórico (compatibilidad); los engines trabajan sobre self.history."""
+        if self._df is None:
+            self._df = self.history.to_dataframe()
+        return self._df
 
     # ─────────────────────────────────────────────────────────────────────────
     # MÉTODO UNIFICADO: Predicción del Reintegro
     # ─────────────────────────────────────────────────────────────────────────
-    def _predict_reintegro(self, context_label='general'):
+    def _predict_reintegro(self, context_label='general', rng=None):
         """
         Predicción unificada del reintegro que:
         1. Filtra datos pre-2004 (reintegro no existía → guardados como 0 falso)
         2. Combina frecuencia reciente + histórica + ciclos
         3. Usa muestreo ponderado (NO determinista) para variabilidad
         """
-        # Filtrar solo datos con reintegro fiable
-        if 'fecha' in self.df.columns:
-            df_valid = self.df[pd.to_datetime(self.df['fecha']) >= REINTEGRO_VALID_FROM]
-        else:
-            # Fallback: usar los últimos 2000 sorteos (aprox post-2004)
-            df_valid = self.df.tail(2000)
-
-        if df_valid.empty or len(df_valid) < 10:
-            return random.randint(0, 9)
-
-        # Componente 1: Frecuencia reciente (últimos 50 sorteos) — peso 55%
-        r_reciente = df_valid['r'].tail(50).value_counts()
-        r_reciente = r_reciente.reindex(range(10), fill_value=0)
-
-        # Componente 2: Frecuencia histórica (solo post-2004) — peso 25%
-        r_historico = df_valid['r'].value_counts()
-        r_historico = r_historico.reindex(range(10), fill_value=0)
-
-        # Componente 3: Ciclo de "retraso" — números que llevan más tiempo sin salir — peso 20%
-        r_lag_scores = pd.Series(0.0, index=range(10))
-        for r_val in range(10):
-            last_positions = df_valid.index[df_valid['r'] == r_val].tolist()
-            if last_positions:
-                lag = len(df_valid) - last_positions[-1] - 1
-                r_lag_scores[r_val] = lag
-            else:
-                r_lag_scores[r_val] = len(df_valid)  # Máximo lag si nunca apareció
-
-        # Normalizar cada componente a [0, 1]
-        def normalize(s):
-            s_min, s_max = s.min(), s.max()
-            if s_max == s_min:
-                return pd.Series(1.0 / len(s), index=s.index)
-            return (s - s_min) / (s_max - s_min)
-
-        score_reciente = normalize(r_reciente.astype(float))
-        score_historico = normalize(r_historico.astype(float))
-        score_lag = normalize(r_lag_scores)
-
-        # Score combinado
-        combined = score_reciente * 0.55 + score_historico * 0.25 + score_lag * 0.20
-
-        # Añadir un floor mínimo para que ningún reintegro tenga probabilidad 0
-        combined = combined + 0.05
-        probabilities = combined / combined.sum()
-
-        # Muestreo ponderado — seleccionar 1 valor según las probabilidades
-        pred_r = int(np.random.choice(range(10), p=probabilities.values))
-        return pred_r
+        rng = self._rng(rng, context_label)
+        return int(rng.choice(10, p=self._reintegro_probabilities()))
+
+    def _sample_reintegros(self, n, rng):
+        """n reintegros (int8) muestreados de la misma distribución que _predict_reintegro."""
+        return rng.choice(10, size=n, p=self._reintegro_probabilities()).astype(np.int8)
+
+    def _reintegro_probabilities(self):
+        """Distribución (10,) del reintegro, calculada una vez por versión del dataset."""
+        if self._reintegro_p is None:
+            key = self.history.version()
+            with _reintegro_lock:
+                p = _reintegro_cache.get(key)
+                if p is None:
+                    p = reintegro_probabilities(self.history)
+                    while len(_reintegro_cache) >= REINTEGRO_CACHE_SIZE:
+                        _reintegro_cache.pop(next(iter(_reintegro_cache)))
+                    _reintegro_cache[key] = p
+            self._reintegro_p = p
+        return self._reintegro_p
 
     # ─────────────────────────────────────────────────────────────────────────
-    # HELPER: Weighted sampling de números con temperatura
+    # HELPER: Muestreo por lotes (Gumbel-top-k) de boletos con temperatura
     # ─────────────────────────────────────────────────────────────────────────
-    def _weighted_sample(self, scores_dict, n=6, temperature=0.7):
+    TICKET_ENGINES = ('lstm_engineer', 'statistician', 'game_theory', 'markov', 'markov_high_order',
+                      'decades', 'clusters', 'genetic', 'temporal_patterns')
+
+    def engine_tickets(self, engine, n=100, rng=None, **kwargs):
         """
-        Selecciona n números de un diccionario {número: score} usando muestreo
-        ponderado con temperatura. Temperatura más alta = más aleatorio.
+        Lote de n boletos de un engine ('statistician', 'markov', ...): los scores se
+        calculan una sola vez y los n boletos salen de una única pasada vectorizada.
+        `kwargs` se pasan al engine (p. ej. `target_dow`, `order`, `generations`).
+        Devuelve (balls (n, 6) int8 con filas ordenadas, reintegros (n,) int8).
         """
-        numbers = list(scores_dict.keys())
-        scores = np.array([scores_dict[n] for n in numbers], dtype=float)
-
-        # Aplicar temperatura (softmax-like)
-        scores = scores - scores.max()  # Estabilidad numérica
-        exp_scores = np.exp(scores / max(temperature, 0.01))
-        probabilities = exp_scores / exp_scores.sum()
-
-        # Muestreo sin reemplazo
-        selected_indices = np.random.choice(
-            len(numbers), size=min(n, len(numbers)),
-            replace=False, p=probabilities
-        )
-        return sorted([numbers[i] for i in selected_indices])
+        if engine not in self.TICKET_ENGINES:
+            raise ValueError(f"Engine desconocido: {engine}")
+        rng = self._rng(rng, engine)
+        balls = getattr(self, f'_tickets_{engine}')(n, rng, **kwargs)
+        return balls, self._sample_reintegros(n, rng)
+
+    def _single_ticket(self, engine, rng, **kwargs):
+        """Un boleto del engine como (lista de 6 números, reintegro): el lote con n=1."""
+        balls, r = self.engine_tickets(engine, 1, rng, **kwargs)
+        return balls[0].tolist(), int(r[0])
+
+    @staticmethod
+    def _candidate_logits(scores, top=None, temperature=0.7):
+        """
+        Logits softmax con temperatura (temperatura más alta = más aleatorio) de scores
+        (49,) o (n, 49); con `top`, solo los `top` mejores de cada fila son candidatos.
+        """
+        scores = np.asarray(scores, dtype=float)
+        logits = (scores - scores.max(axis=-1, keepdims=True)) / max(temperature, 0.01)
+        if top is not None:
+            # Orden estable: a igualdad de score gana el número menor
+            rest = np.argsort(-scores, axis=-1, kind='stable')[..., top:]
+            logits = logits.copy()
+            np.put_along_axis(logits, rest, -np.inf, axis=-1)
+        return logits
+
+    @staticmethod
+    def _gumbel_tickets(logits, n, rng, k=6):
+        """
+        n boletos de k números sin reemplazo, cada uno ∝ softmax(logits), en una pasada:
+        top-k de logits + ruido Gumbel (equivale a muestreo secuencial sin reemplazo).
+        `logits` es (49,) compartido o (n, 49) por boleto; -inf excluye un número.
+        """
+        keys = np.broadcast_to(logits, (n, 49)) + rng.gumbel(size=(n, 49))
+        picks = np.argpartition(-keys, k - 1, axis=1)[:, :k] + 1
+        return np.sort(picks, axis=1).astype(np.int8)
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # HELPER: Top-K exacto de combinaciones bajo los scores de un engine
+    # ─────────────────────────────────────────────────────────────────────────
+    SCORE_ENGINES = ('statistician', 'markov', 'markov_high_order', 'genetic', 'temporal')
+
+    def top_combinations(self, engine='statistician', k=10, sum_range=SUM_RANGE, sum_penalty=0.8,
+                         decade_bonus=0.05, pair_weight=0.0):
+        """
+        Las k combinaciones de mayor score exacto (sin muestreo) para el vector de scores de
+        `engine` (`<engine>_scores()`), con penalización por suma fuera de `sum_range`,
+        bonus por décadas distintas y, con `pair_weight` > 0, un término por pares según
+        la co-ocurrencia histórica. Devuelve (balls (k, 6), scores (k,)).
+        """
+        if engine not in self.SCORE_ENGINES:
+            raise ValueError(f"Engine sin vector de scores: {engine}")
+        ball_scores = getattr(self, f'{engine}_scores')()
+        pair_scores = None
+        if pair_weight:
+            cooc = self.history.pair_counts().astype(float)
+            pair_scores = pair_weight * cooc / max(cooc.max(), 1)
+        return top_k_combinations(ball_scores, k=k, pair_scores=pair_scores, sum_range=sum_range,
+                                  sum_penalty=sum_penalty, decade_bonus=decade_bonus)
 
     # ─────────────────────────────────────────────────────────────────────────
     # ENGINE 1: LSTM mejorado con features enriquecidas
     # ─────────────────────────────────────────────────────────────────────────
-    def engine_lstm_engineer(self, force_train=False):
+    def engine_lstm_engineer(self, force_train=False, rng=None):
         """Deep Learning: BiLSTM profundo con features enriquecidas y lookback extendido."""
-        if not TF_AVAILABLE:
-            nums = sorted(random.sample(range(1, 50), 6))
-            return nums, self._predict_reintegro('lstm_fallback')
-
-        lookback = 60
-
-        # Feature engineering enriquecido: one-hot (49) + meta-features (7) = 56 dims
-        data_series = []
-        for idx, row in self.df[self.ball_cols].iterrows():
-            # One-hot encoding de 49 bolas
-            vector = np.zeros(49)
-            nums_in_row = [int(v) for v in row.values]
-            for val in nums_in_row:
-                vector[val - 1] = 1
-
-            # Meta-features adicionales
-            ball_sum = sum(nums_in_row) / 294.0  # Normalizado (máx teórico: 44+45+46+47+48+49=279, usamos 294)
-            parity = sum(1 for n in nums_in_row if n % 2 == 0) / 6.0  # Ratio de pares
-            high_low = sum(1 for n in nums_in_row if n > 24) / 6.0  # Ratio altos
-            spread = (max(nums_in_row) - min(nums_in_row)) / 48.0  # Rango normalizado
-            # Distribución por tercios
-            tercio1 = sum(1 for n in nums_in_row if n <= 16) / 6.0
-            tercio2 = sum(1 for n in nums_in_row if 17 <= n <= 33) / 6.0
-            tercio3 = sum(1 for n in nums_in_row if n >= 34) / 6.0
-
-            meta = [ball_sum, parity, high_low, spread, tercio1, tercio2, tercio3]
-            full_vector = np.concatenate([vector, meta])
-            data_series.append(full_vector)
-
-        feature_dim = len(data_series[0])  # 56
-
-        # Solo usar one-hot para las labels (predecir qué bolas salen)
-        label_series = []
-        for _, row in self.df[self.ball_cols].iterrows():
-            vector = np.zeros(49)
-            for val in row.values:
-                vector[int(val) - 1] = 1
-            label_series.append(vector)
-
-        X = np.array([data_series[i:i + lookback] for i in range(len(data_series) - lookback)])
-        y = np.array(label_series[lookback:])
-
-        model = None
-        if os.path.exists(MODEL_PATH) and not force_train:
-            try:
-                model = load_model(MODEL_PATH)
-                # Verificar que la forma de entrada coincide
-                expected_shape = (lookback, feature_dim)
-                if model.input_shape[1:] != expected_shape:
-                    model = None  # Modelo incompatible, reentrenar
-            except:
-                model = None
-
-        if model is None:
-            model = Sequential([
-                Bidirectional(LSTM(128, return_sequences=True), input_shape=(lookback, feature_dim)),
-                Dropout(0.25),
-                BatchNormalization(),
-                Bidirectional(LSTM(64, return_sequences=False)),
-                Dropout(0.25),
-                Dense(128, activation='relu'),
-                Dropout(0.15),
-                Dense(64, activation='relu'),
-                Dense(49, activation='sigmoid')
-            ])
-            optimizer = Adam(learning_rate=0.001)
-            model.compile(optimizer=optimizer, loss='binary_crossentropy')
-
-            early_stop = EarlyStopping(patience=7, restore_best_weights=True, monitor='val_loss')
-            lr_scheduler = ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=3, min_lr=1e-6)
-
-            model.fit(
-                X, y,
-                epochs=80,
-                verbose=0,
-                batch_size=32,
-                validation_split=0.1,
-                callbacks=[early_stop, lr_scheduler]
-            )
-            os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
-            model.save(MODEL_PATH)
-
-        last_seq = np.array(data_series[-lookback:]).reshape(1, lookback, feature_dim)
-        pred = model.predict(last_seq, verbose=0)[0]
+        return self._single_ticket('lstm_engineer', rng, force_train=force_train)
 
+    def _tickets_lstm_engineer(self, n, rng, force_train=False):
+        scores = self.lstm_scores(force_train=force_train)
+        if scores is None:
+            return random_population(n, rng)
         # Selección con algo de muestreo ponderado (no puramente argmax)
-        scores = {i + 1: float(pred[i]) for i in range(49)}
-        result = self._weighted_sample(scores, n=6, temperature=0.4)
+        return self._gumbel_tickets(self._candidate_logits(scores, temperature=0.4), n, rng)
+
+    def lstm_scores(self, force_train=False):
+        """
+        Probabilidad por bola (49,) predicha por el BiLSTM para el próximo sorteo (None sin
+        histórico suficiente o sin modelo utilizable). Si hay pesos exportados al día basta
+        NumPy; TensorFlow solo se carga para entrenar o si no hay artefacto.
+        """
+        if len(self.history) <= LOOKBACK + 1:
+            return None
+
+        # Feature engineering enriquecido: one-hot (49) + meta-features (7) = 56 dims.
+        # La inferencia solo necesita las últimas LOOKBACK filas; el entrenamiento, la matriz en mmap
+        window = feature_window(self.history)
+        if not force_train:
+            numpy_model = resident_numpy_model(MODEL_PATH)
+            if numpy_model is not None:
+                return numpy_model.predict(window[None])[0]
+        if not TF_AVAILABLE:
+            return None
 
-        pred_r = self._predict_reintegro('lstm')
-        return result, pred_r
+        # El modelo queda residente en el proceso (TensorFlow se importa aquí, en el primer uso)
+        resident = None if force_train else resident_model()
+        if resident is None:
+            train_model(feature_matrix(self.history), version=self.history.version())
+            resident = resident_model()
+        _, predict = resident
+        return predict_next(predict, window)
 
     # ─────────────────────────────────────────────────────────────────────────
     # ENGINE 2: Estadístico (frecuencia + lag + variabilidad)
     # ─────────────────────────────────────────────────────────────────────────
-    def engine_statistician(self):
+    def engine_statistician(self, rng=None):
         """Frecuencia + Retraso con muestreo ponderado para variabilidad."""
-        df_reset = self.df
-
-        freqs = df_reset[self.ball_cols].stack().value_counts().sort_index()
-        freqs = freqs.reindex(range(1, 50), fill_value=0)
-
-        total = len(df_reset)
-        last_seen = {}
-        for n in range(1, 50):
-            mask = df_reset[self.ball_cols].isin([n]).any(axis=1)
-            positions = df_reset[mask].index.tolist()
-            last_seen[n] = total - positions[-1] - 1 if positions else total
-
-        max_freq = freqs.max() if freqs.max() > 0 else 1
-        max_lag = max(last_seen.values()) if max(last_seen.values()) > 0 else 1
-
-        scores = {}
-        for n in range(1, 50):
-            norm_freq = freqs[n] / max_freq
-            norm_lag = last_seen[n] / max_lag
-            scores[n] = (norm_lag * 0.6) + (norm_freq * 0.4)
+        return self._single_ticket('statistician', rng)
 
+    def _tickets_statistician(self, n, rng):
         # Muestreo ponderado del top-15 en vez de tomar top-6 determinista
-        top_candidates = sorted(scores, key=scores.get, reverse=True)[:15]
-        candidate_scores = {n: scores[n] for n in top_candidates}
-        top_balls = self._weighted_sample(candidate_scores, n=6, temperature=0.6)
-
-        pred_r = self._predict_reintegro('statistician')
-        return top_balls, pred_r
+        logits = self._candidate_logits(self.statistician_scores(), top=15, temperature=0.6)
+        return self._gumbel_tickets(logits, n, rng)
+
+    def statistician_scores(self):
+        """Score por bola del estadístico: 60% retraso + 40% frecuencia, normalizados."""
+        stats = self.stats
+        freqs = stats.counts
+        lags = stats.lag()
+        max_freq = freqs.max() if freqs.max() > 0 else 1
+        max_lag = lags.max() if lags.max() > 0 else 1
+        return (lags / max_lag * 0.6) + (freqs / max_freq * 0.4)
 
     # ─────────────────────────────────────────────────────────────────────────
     # ENGINE 3: Teoría de Juegos (Anti-Humano mejorado)
     # ─────────────────────────────────────────────────────────────────────────
-    def engine_game_theory(self):
+    def engine_game_theory(self, rng=None, top_ev=False):
         """Combinaciones diseñadas para ser únicas y evitar compartir el premio.
-        Ahora incorpora datos históricos para evitar combinaciones populares."""
-        # Analizar combinaciones "populares" (más elegidas por humanos)
-        popular_nums = {7, 13, 14, 21, 28, 35, 42, 49}  # Múltiplos de 7
-        popular_nums.update({1, 2, 3, 4, 5, 6})  # Secuencias bajas
-        popular_nums.update({11, 22, 33, 44})  # Repetidos
-
-        while True:
-            nums = sorted(random.sample(range(1, 50), 6))
-            if not (115 <= sum(nums) <= 185): continue
-            consecutives = sum(1 for i in range(len(nums) - 1) if nums[i + 1] == nums[i] + 1)
-            if consecutives > 2: continue
-            low_nums = sum(1 for n in nums if n <= 31)
-            if low_nums > 4: continue
-            if not any(n <= 24 for n in nums) or not any(n > 24 for n in nums): continue
-
-            # Nuevo: penalizar si muchos números son "populares"
-            popular_count = sum(1 for n in nums if n in popular_nums)
-            if popular_count > 2: continue
-
-            pred_r = self._predict_reintegro('game_theory')
-            return nums, pred_r
+        Ahora incorpora datos históricos para evitar combinaciones populares.
+        Con `top_ev`, solo entre las de mayor valor esperado (src/expected_value.py)."""
+        return self._single_ticket('game_theory', rng, top_ev=top_ev)
+
+    def _tickets_game_theory(self, n, rng, top_ev=False):
+        # Muestreo uniforme, sin repetición, del índice precalculado de combinaciones que
+        # cumplen las reglas anti-humanas: suma 115-185, ≤2 consecutivos, ≤4 "fechas"
+        # (≤31), mezcla de bajos/altos y ≤2 números populares (src/combinations.py)
+        if not top_ev:
+            return sample_game_theory(n, rng)
+        # Entre esas, las que menos jugadores eligen. El top incluye el empate completo
+        # con la K-ésima, así que el muestreo no depende del orden de enumeración.
+        # Sin pool de procesos dentro de un engine.
+        tickets, _ = top_ev_tickets(k=GAME_THEORY_TOP_K, valid_only=True, ties=True, workers=1)
+        picks = rng.choice(len(tickets), size=n, replace=n > len(tickets))
+        return tickets[picks]
 
     # ─────────────────────────────────────────────────────────────────────────
     # ENGINE 4: Cadenas de Markov con variabilidad
     # ─────────────────────────────────────────────────────────────────────────
-    def engine_markov(self):
+    def engine_markov(self, rng=None):
         """Cadenas de Markov de 1er orden con ruido y muestreo ponderado."""
-        transition_matrix = np.zeros((49, 49))
-
-        # Ponderar transiciones recientes más que antiguas
-        rows = self.df[self.ball_cols].values
-        n_rows = len(rows)
-        for i in range(n_rows - 1):
-            current_balls = [int(x) - 1 for x in rows[i]]
-            next_balls = [int(x) - 1 for x in rows[i + 1]]
-            # Peso exponencial: sorteos más recientes pesan más
-            recency_weight = 1.0 + 2.0 * (i / n_rows)  # De 1.0 a 3.0
-            for cb in current_balls:
-                for nb in next_balls:
-                    transition_matrix[cb][nb] += recency_weight
+        return self._single_ticket('markov', rng)
+
+    def _tickets_markov(self, n, rng):
+        scores = self.markov_scores()
+
+        # Añadir ruido gaussiano para variabilidad (independiente por boleto)
+        noise = rng.normal(0, scores.std() * 0.15, (n, 49))
+        scores = np.maximum(scores + noise, 0)
+
+        # Muestreo ponderado del top-12 de cada boleto
+        logits = self._candidate_logits(scores, top=12, temperature=0.5)
+        return self._gumbel_tickets(logits, n, rng)
+
+    def markov_scores(self):
+        """Score por bola de Markov de 1er orden: Σ de las filas de transición del último sorteo."""
+        # Ponderar transiciones recientes más que antiguas: peso 1.0 + 2.0·(i / n), de 1.0 a 3.0
+        # (acumulado incrementalmente en TransitionCounts)
+        transition_matrix = self.history.transitions().matrix()
 
         row_sums = transition_matrix.sum(axis=1, keepdims=True)
         row_sums[row_sums == 0] = 1
         transition_matrix = transition_matrix / row_sums
 
-        last_balls = [int(x) - 1 for x in self.df[self.ball_cols].iloc[-1].values]
+        last_balls = [int(x) - 1 for x in self.history.last_draw()]
         scores = np.zeros(49)
         for lb in last_balls:
             scores += transition_matrix[lb]
@@ -307,272 +328,199 @@ class LottoEngines:
         # Reducir score de bolas del último sorteo (evitar repetición directa)
         for lb in last_balls:
             scores[lb] *= 0.3
+        return scores
+
+    # ─────────────────────────────────────────────────────────────────────────
+    # ENGINE 4b: Markov de orden superior sobre pares / tríos de bolas
+    # ─────────────────────────────────────────────────────────────────────────
+    def engine_markov_high_order(self, order=2, rng=None):
+        """Markov disperso de orden 2/3: P(bola | par o trío del último sorteo) con suavizado de Laplace."""
+        return self._single_ticket('markov_high_order', rng, order=order)
+
+    def _tickets_markov_high_order(self, n, rng, order=2):
+        if len(self.history) < 2:
+            return random_population(n, rng)
 
-        # Añadir ruido gaussiano para variabilidad
-        noise = np.random.normal(0, scores.std() * 0.15, 49)
+        scores = self.markov_high_order_scores(order=order)
+
+        # Ruido gaussiano para variabilidad (independiente por boleto)
+        noise = rng.normal(0, scores.std() * 0.15, (n, 49))
         scores = np.maximum(scores + noise, 0)
 
-        # Muestreo ponderado del top-12
-        score_dict = {i + 1: float(scores[i]) for i in range(49)}
-        top_candidates = sorted(score_dict, key=score_dict.get, reverse=True)[:12]
-        candidate_scores = {n: score_dict[n] for n in top_candidates}
-        result = self._weighted_sample(candidate_scores, n=6, temperature=0.5)
+        # Muestreo ponderado del top-12 (scores reescalados: son sumas de probabilidades)
+        max_score = scores.max(axis=1, keepdims=True)
+        scores = scores / np.where(max_score > 0, max_score, 1.0)
+        logits = self._candidate_logits(scores, top=12, temperature=0.5)
+        return self._gumbel_tickets(logits, n, rng)
+
+    def markov_high_order_scores(self, order=2):
+        """Score por bola de Markov de orden 2/3 (suma de probabilidades por par / trío)."""
+        scores = self.history.tuple_transition_scores(order=order)
 
-        pred_r = self._predict_reintegro('markov')
-        return result, pred_r
+        # Reducir score de bolas del último sorteo (evitar repetición directa)
+        last_balls = self.history.last_draw() - 1
+        scores[last_balls] *= 0.3
+        return scores
 
     # ─────────────────────────────────────────────────────────────────────────
     # ENGINE 5: Análisis de Décadas con variabilidad
     # ─────────────────────────────────────────────────────────────────────────
-    def engine_decades(self):
+    def engine_decades(self, rng=None):
         """Selección basada en las décadas más frías recientemente con variabilidad."""
-        decenas = [(1, 7), (8, 14), (15, 21), (22, 28), (29, 35), (36, 42), (43, 49)]
-        recientes = self.df[self.ball_cols].tail(100)
-        decena_scores = {}
-        for i, (lo, hi) in enumerate(decenas):
-            count = recientes.apply(lambda row: sum(1 for v in row.values if lo <= v <= hi), axis=1).sum()
-            decena_scores[i] = int(count)
+        return self._single_ticket('decades', rng)
 
-        sorted_decenas = sorted(decena_scores.items(), key=lambda x: x[1])
+    def _tickets_decades(self, n, rng):
+        # Las 7 décadas (1-7, 8-14, ..., 43-49) son bloques contiguos del vector de 49:
+        # un número de cada una de las 6 décadas más frías de los últimos 100 sorteos
+        decena_scores = self.history.frequencies(last=100).reshape(7, 7).sum(axis=1)
+        sorted_decenas = np.argsort(decena_scores, kind='stable')[:6]
 
         # Frecuencias recientes (no globales) para reducir repetitividad
-        recientes_500 = self.df[self.ball_cols].tail(500)
-        freqs_reciente = recientes_500.stack().value_counts()
-
-        result = []
-        for idx, _ in sorted_decenas:
-            lo, hi = decenas[idx]
-            candidates = list(range(lo, hi + 1))
-            # Construir scores por candidato dentro de la década
-            candidate_scores = {}
-            for n in candidates:
-                freq = freqs_reciente.get(n, 0)
-                candidate_scores[n] = float(freq)
-
-            # Muestrear 1 de los top-3 de la década (no siempre el mejor)
-            if candidate_scores:
-                selected = self._weighted_sample(candidate_scores, n=1, temperature=0.8)
-                result.extend(selected)
-
-            if len(result) >= 6:
-                break
-
-        # Si por alguna razón tenemos menos de 6, rellenar
-        while len(result) < 6:
-            n = random.randint(1, 49)
-            if n not in result:
-                result.append(n)
-
-        pred_r = self._predict_reintegro('decades')
-        return sorted(result[:6]), pred_r
+        freqs_reciente = self.history.frequencies(last=500).reshape(7, 7)[sorted_decenas]
+        logits = self._candidate_logits(freqs_reciente, temperature=0.8)
 
+        # Muestrear 1 candidato por década (no siempre el mejor): Gumbel-argmax por fila
+        picks = (logits + rng.gumbel(size=(n, 6, 7))).argmax(axis=2)
+        return np.sort(7 * sorted_decenas + picks + 1, axis=1).astype(np.int8)
 
     # ─────────────────────────────────────────────────────────────────────────
     # ENGINE 7: Análisis de Clústeres (K-Means) con recencia
     # ─────────────────────────────────────────────────────────────────────────
-    def engine_clusters(self):
-        """Identifica clústeres de sorteos similares con ponderación por recencia."""
-        if KMeans is None:
-            return self.engine_game_theory()
-
-        X = self.df[self.ball_cols].values
-        kmeans = KMeans(n_clusters=10, random_state=42, n_init=10)
-        clusters = kmeans.fit_predict(X)
+    def engine_clusters(self, rng=None, refit_every=CLUSTER_REFIT_EVERY):
+        """
+        Identifica clústeres de sorteos similares con ponderación por recencia.
+        El modelo se reutiliza entre históricos que se extienden y solo se reajusta
+        (partial_fit) cada `refit_every` sorteos nuevos.
+        """
+        return self._single_ticket('clusters', rng, refit_every=refit_every)
+
+    def _tickets_clusters(self, n, rng, refit_every=CLUSTER_REFIT_EVERY):
+        if not CLUSTERING_AVAILABLE or len(self.history) < 10:
+            return self._tickets_game_theory(n, rng)
+
+        # Modelo en caché por versión del dataset: en walk-forward solo se asignan los sorteos nuevos
+        X = self.history.balls
+        clusters = draw_clusters(self.history, refit_every=refit_every).labels
         last_cluster = clusters[-1]
         cluster_mask = clusters == last_cluster
-        cluster_draws = self.df[cluster_mask]
+        cluster_draws = X[cluster_mask]
 
-        if cluster_draws.empty or len(cluster_draws) < 3:
-            return self.engine_game_theory()
+        if len(cluster_draws) < 3:
+            return self._tickets_game_theory(n, rng)
 
         # Ponderar frecuencias del clúster por recencia
         cluster_indices = np.where(cluster_mask)[0]
         max_idx = cluster_indices.max()
-        weighted_freqs = Counter()
-        for ci in cluster_indices:
-            recency_weight = 1.0 + 2.0 * (ci / max_idx) if max_idx > 0 else 1.0
-            for col in self.ball_cols:
-                ball = int(self.df.loc[ci, col])
-                weighted_freqs[ball] += recency_weight
+        recency = 1.0 + 2.0 * (cluster_indices / max_idx) if max_idx > 0 else np.ones(len(cluster_indices))
+        weighted_freqs = np.bincount(cluster_draws.astype(np.intp).ravel() - 1,
+                                     weights=np.repeat(recency, 6), minlength=49)
 
-        last_draw = set(int(v) for v in self.df[self.ball_cols].iloc[-1].values)
+        # Excluir bolas del último sorteo (fallback: incluir todas las del clúster)
+        candidates = weighted_freqs > 0
+        fresh = candidates.copy()
+        fresh[self.history.last_draw() - 1] = False
+        if fresh.sum() >= 6:
+            candidates = fresh
 
-        # Excluir bolas del último sorteo y construir scores
-        candidate_scores = {ball: score for ball, score in weighted_freqs.items() if ball not in last_draw}
-
-        if len(candidate_scores) < 6:
-            # Fallback: incluir todas
-            candidate_scores = dict(weighted_freqs)
-
-        result = self._weighted_sample(candidate_scores, n=6, temperature=0.6)
-
-        pred_r = self._predict_reintegro('clusters')
-        return result, pred_r
+        logits = np.where(candidates, self._candidate_logits(weighted_freqs, temperature=0.6), -np.inf)
+        return self._gumbel_tickets(logits, n, rng)
 
     # ─────────────────────────────────────────────────────────────────────────
     # ENGINE 8: Algoritmo Genético mejorado
     # ─────────────────────────────────────────────────────────────────────────
-    def engine_genetic(self, generations=80, pop_size=150):
-        """Evoluciona una población de combinaciones con operadores mejorados."""
-        # Usar frecuencias recientes (últimos 500) y globales
-        freqs_global = self.df[self.ball_cols].stack().value_counts(normalize=True).to_dict()
-        freqs_recent = self.df[self.ball_cols].tail(500).stack().value_counts(normalize=True).to_dict()
-
-        # Score de lag por número
-        total = len(self.df)
-        lag_scores = {}
-        for n in range(1, 50):
-            mask = self.df[self.ball_cols].isin([n]).any(axis=1)
-            positions = self.df[mask].index.tolist()
-            lag = total - positions[-1] - 1 if positions else total
-            lag_scores[n] = lag / total
-
-        def calculate_fitness(comb):
-            # Frecuencia: mix de global y reciente
-            f_global = sum(freqs_global.get(n, 0) for n in comb)
-            f_recent = sum(freqs_recent.get(n, 0) for n in comb)
-            f_score = f_global * 0.4 + f_recent * 0.6
-
-            # Bonus por lag (números "calientes" por retraso)
-            lag_bonus = sum(lag_scores.get(n, 0) for n in comb) * 0.3
-
-            # Penalización por suma fuera de rango
-            s = sum(comb)
-            s_penalty = 0 if 115 <= s <= 185 else -0.8
-
-            # Penalización por consecutivos excesivos
-            c = sum(1 for i in range(len(comb) - 1) if comb[i + 1] == comb[i] + 1)
-            c_penalty = -0.3 * max(c - 1, 0)
-
-            # Bonus por diversidad de décadas
-            decades_used = len(set((n - 1) // 7 for n in comb))
-            diversity_bonus = decades_used * 0.05
-
-            return f_score + lag_bonus + s_penalty + c_penalty + diversity_bonus
-
-        population = [sorted(random.sample(range(1, 50), 6)) for _ in range(pop_size)]
-
-        for gen in range(generations):
-            population = sorted(population, key=calculate_fitness, reverse=True)
-            # Elitismo: mantener el top 20%
-            elite_size = max(pop_size // 5, 2)
-            next_gen = population[:elite_size]
-
-            while len(next_gen) < pop_size:
-                # Selección por torneo (más variedad que coger siempre el top-10)
-                tournament = random.sample(next_gen[:max(elite_size, 10)], min(3, len(next_gen)))
-                parent1 = max(tournament, key=calculate_fitness)
-                tournament = random.sample(next_gen[:max(elite_size, 10)], min(3, len(next_gen)))
-                parent2 = max(tournament, key=calculate_fitness)
-
-                # Crossover de 2 puntos
-                cp1, cp2 = sorted(random.sample(range(6), 2))
-                child_set = set(parent1[:cp1] + parent2[cp1:cp2] + parent1[cp2:])
-
-                # Asegurar exactamente 6 números únicos
-                child = list(child_set)
-                while len(child) < 6:
-                    n = random.randint(1, 49)
-                    if n not in child:
-                        child.append(n)
-                child = sorted(child[:6])
-
-                # Mutación adaptativa (más alta al principio, menos al final)
-                mutation_rate = 0.15 * (1 - gen / generations) + 0.03
-                if random.random() < mutation_rate:
-                    idx = random.randint(0, 5)
-                    new_n = random.randint(1, 49)
-                    if new_n not in child:
-                        child[idx] = new_n
-                        child = sorted(child)
-
-                next_gen.append(child)
-
-            population = next_gen
-
-        # No tomar siempre el #1; muestrear del top-5
-        top5 = population[:5]
-        best_comb = random.choice(top5)
-
-        pred_r = self._predict_reintegro('genetic')
-        return sorted(best_comb), pred_r
+    def engine_genetic(self, generations=80, pop_size=150, rng=None,
+                       islands=None, workers=None, time_budget=None):
+        """
+        Evoluciona una población de combinaciones con operadores mejorados.
+
+        Con `islands` > 1 usa el modelo de islas en un pool de `workers` procesos:
+        `generations` pasa a ser el máximo (hay parada por convergencia) y `time_budget`
+        limita el tiempo en segundos. Sin `islands`, una sola población en este proceso.
+        """
+        return self._single_ticket('genetic', rng, generations=generations, pop_size=pop_size,
+                                   islands=islands, workers=workers, time_budget=time_budget)
+
+    def _tickets_genetic(self, n, rng, generations=80, pop_size=150,
+                         islands=None, workers=None, time_budget=None):
+        ball_scores = self.genetic_scores()
+        if islands and islands > 1:
+            population, _, _ = evolve_islands(
+                ball_scores, n_islands=islands, pop_size=pop_size, max_generations=generations,
+                time_budget=time_budget, workers=workers, seed=int(rng.integers(2**63)),
+            )
+        else:
+            population, _ = evolve(ball_scores, generations=generations, pop_size=pop_size, rng=rng)
+
+        # La población final converge: quitar duplicados conservando el orden por fitness.
+        # No tomar siempre el #1: un boleto sale de los 5 mejores distintos y un lote de
+        # los n mejores distintos (con repetición solo si no hay tantos)
+        _, first = np.unique(population, axis=0, return_index=True)
+        elite = population[np.sort(first)][:max(n, 5)]
+        return elite[rng.choice(len(elite), size=n, replace=n > len(elite))]
+
+    def genetic_scores(self):
+        """Score por bola del genético: mix de frecuencia global/reciente + bonus por lag."""
+        stats = self.stats
+        counts_global = stats.counts.astype(float)
+        counts_recent = self.history.frequencies(last=500).astype(float)
+        f_global = counts_global / max(counts_global.sum(), 1)
+        f_recent = counts_recent / max(counts_recent.sum(), 1)
+        lag_scores = stats.lag() / max(stats.n, 1)
+        return f_global * 0.4 + f_recent * 0.6 + lag_scores * 0.3
 
     # ─────────────────────────────────────────────────────────────────────────
     # ENGINE 9: Patrones Temporales (NUEVO)
     # ─────────────────────────────────────────────────────────────────────────
-    def engine_temporal_patterns(self):
-        """Analiza ciclos de aparición, co-ocurrencias y patrones por día de sorteo."""
-        total = len(self.df)
-        if total < 100:
-            return sorted(random.sample(range(1, 50), 6)), self._predict_reintegro('temporal')
+    def engine_temporal_patterns(self, target_dow=None, rng=None):
+        """
+        Analiza ciclos de aparición, co-ocurrencias y patrones por día de sorteo.
+        `target_dow` (0=lunes) es el día del sorteo a predecir; por defecto el del próximo sorteo.
+        """
+        return self._single_ticket('temporal_patterns', rng, target_dow=target_dow)
+
+    def _tickets_temporal_patterns(self, n, rng, target_dow=None):
+        if len(self.history) < 100:
+            return random_population(n, rng)
+        logits = self._candidate_logits(self.temporal_scores(target_dow), temperature=0.6)
+        return self._gumbel_tickets(logits, n, rng)
+
+    def temporal_scores(self, target_dow=None):
+        """Score por bola de patrones temporales: 45% ciclo + 25% co-ocurrencia + 30% día de la semana."""
+        h = self.history
 
         # ── 1. Análisis de ciclo medio por número ──
-        cycle_scores = {}
-        for n in range(1, 50):
-            mask = self.df[self.ball_cols].isin([n]).any(axis=1)
-            positions = self.df[mask].index.tolist()
-            if len(positions) >= 2:
-                # Calcular gaps entre apariciones
-                gaps = [positions[i + 1] - positions[i] for i in range(len(positions) - 1)]
-                avg_cycle = np.mean(gaps)
-                current_gap = total - positions[-1] - 1
-
-                # Score: cuánto más "atrasado" está respecto a su ciclo, mayor probabilidad
-                if avg_cycle > 0:
-                    cycle_scores[n] = current_gap / avg_cycle
-                else:
-                    cycle_scores[n] = 0
-            else:
-                cycle_scores[n] = 2.0  # Alto score si apenas ha aparecido
+        # Score: cuánto más "atrasado" está cada número respecto a su ciclo medio
+        stats = self.stats
+        mean_gaps = stats.mean_gap()
+        cycle_scores = np.divide(stats.lag(), mean_gaps,
+                                 out=np.zeros(49), where=mean_gaps > 0)
+        cycle_scores[stats.gap_count < 1] = 2.0  # Alto score si apenas ha aparecido
 
         # ── 2. Co-ocurrencias (qué números tienden a salir juntos) ──
         # Usar los últimos 5 sorteos como "contexto"
-        recent_balls = set()
-        for i in range(-1, max(-6, -total), -1):
-            for col in self.ball_cols:
-                recent_balls.add(int(self.df[col].iloc[i]))
-
-        cooccurrence_boost = Counter()
-        for _, row in self.df[self.ball_cols].tail(500).iterrows():
-            draw = set(int(v) for v in row.values)
-            overlap = draw & recent_balls
-            if len(overlap) >= 2:
-                for n in draw - recent_balls:
-                    cooccurrence_boost[n] += len(overlap) * 0.1
+        recent = balls_to_onehot(h.balls[-5:]).any(axis=0)
+        window = balls_to_onehot(h.balls[-500:])
+        overlap = window @ recent
+        # Cada sorteo con ≥2 números del contexto refuerza a sus compañeros
+        cooccurrence_boost = (np.where(overlap >= 2, overlap, 0) * 0.1) @ window
+        cooccurrence_boost[recent] = 0
 
         # ── 3. Patrones por día de la semana (L/J/S) ──
-        day_scores = {}
-        if 'fecha' in self.df.columns:
-            self.df['_dow'] = pd.to_datetime(self.df['fecha']).dt.dayofweek
-            # Próximo sorteo: determinar qué día es
-            from src.etl import proximo_sorteo
-            proximo = proximo_sorteo()
-            target_dow = proximo.weekday() if proximo else None
-
-            if target_dow is not None:
-                same_day_draws = self.df[self.df['_dow'] == target_dow]
-                if len(same_day_draws) > 20:
-                    day_freqs = same_day_draws[self.ball_cols].tail(200).stack().value_counts()
-                    day_freqs = day_freqs.reindex(range(1, 50), fill_value=0)
-                    max_day_freq = day_freqs.max() if day_freqs.max() > 0 else 1
-                    for n in range(1, 50):
-                        day_scores[n] = float(day_freqs.get(n, 0)) / max_day_freq
-
-            # Limpiar columna temporal
-            self.df.drop(columns=['_dow'], inplace=True, errors='ignore')
+        day_scores = np.full(49, 0.5)  # 0.5 neutral si no hay datos
+        if h.has_dates:
+            if target_dow is None:
+                # Próximo sorteo: determinar qué día es
+                from src.etl import proximo_sorteo
+                proximo = proximo_sorteo()
+                target_dow = proximo.weekday() if proximo else None
+
+            if target_dow is not None and h.weekday_count(target_dow) > 20:
+                day_freqs = h.weekday_frequencies(target_dow, last=200)
+                day_scores = day_freqs / max(day_freqs.max(), 1)
 
         # ── Combinar los 3 componentes ──
-        combined_scores = {}
-        max_cycle = max(cycle_scores.values()) if cycle_scores else 1
-        max_cooc = max(cooccurrence_boost.values()) if cooccurrence_boost else 1
-
-        for n in range(1, 50):
-            s_cycle = cycle_scores.get(n, 0) / max_cycle if max_cycle > 0 else 0
-            s_cooc = cooccurrence_boost.get(n, 0) / max_cooc if max_cooc > 0 else 0
-            s_day = day_scores.get(n, 0.5)  # 0.5 neutral si no hay datos
-
-            combined_scores[n] = s_cycle * 0.45 + s_cooc * 0.25 + s_day * 0.30
+        max_cycle = cycle_scores.max()
+        s_cycle = cycle_scores / max_cycle if max_cycle > 0 else np.zeros(49)
+        s_cooc = cooccurrence_boost / max(cooccurrence_boost.max(), 1e-12)
 
-        result = self._weighted_sample(combined_scores, n=6, temperature=0.6)
-        pred_r = self._predict_reintegro('temporal')
-        return result, pred_r
+        return s_cycle * 0.45 + s_cooc * 0.25 + day_scores * 0.30
@@ -1,16 +1,69 @@
 # src/etl.py
 import pandas as pd
+import numpy as np
 import requests
 import json
 from datetime import datetime, timedelta
 import os
+import shutil
+import tempfile
+import time
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_PATH = os.path.join(BASE_DIR, 'data', 'historico.csv')
 
+# Copia binaria columnar del histórico (se regenera cuando cambia el CSV)
+STORE_PATH = os.path.join(BASE_DIR, 'data', 'cache', 'historico.npz')
+STORE_COLS = ['n1', 'n2', 'n3', 'n4', 'n5', 'n6', 'c', 'r']
+# Versión del contenido de la copia binaria: subirla al cambiar la validación o el parseo
+# (2: bolas en orden canónico) invalida las copias construidas con las reglas anteriores
+STORE_SCHEMA = 2
+
+# Marca de agua de la ingesta incremental (último sorteo registrado + firma del CSV)
+MARCA_AGUA_PATH = os.path.join(BASE_DIR, 'data', 'cache', 'marca_agua.json')
+
+# Caché en disco de las respuestas crudas de buscadorSorteos, una por año
+RAW_CACHE_DIR = os.path.join(BASE_DIR, 'data', 'cache', 'raw')
+# Días tras el 31/12 en los que un año aún se revalida antes de marcarlo inmutable
+CACHE_GRACIA_DIAS = 7
+
+# Combinación "N1 - N2 - N3 - N4 - N5 - N6 C(CC) R(R)"; complementario y reintegro opcionales
+PATRON_COMBINACION = r'^\D*(\d+)\D+(\d+)\D+(\d+)\D+(\d+)\D+(\d+)\D+(\d+)(?:\D+(\d+))?(?:\D+(\d+))?'
+
+# Endpoint oficial (sobreescribible para apuntar a un servidor local de pruebas)
+API_URL = os.environ.get('LOTTO_API_URL', 'https://www.loteriasyapuestas.es/servicios/buscadorSorteos')
+
+# Descarga concurrente: workers, reintentos por año y backoff base (segundos)
+DESCARGA_WORKERS = 6
+DESCARGA_REINTENTOS = 3
+DESCARGA_BACKOFF = 1.0
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'es-ES,es;q=0.9,en;q=0.8',
+    'Referer': 'https://www.loteriasyapuestas.es/es/la-primitiva',
+    'Cache-Control': 'no-cache',
+    'Pragma': 'no-cache',
+    'Sec-Ch-Ua': '"Not A(Brand";v="99", "Google Chrome";v="121", "Chromium";v="121"',
+    'Sec-Ch-Ua-Mobile': '?0',
+    'Sec-Ch-Ua-Platform': '"Linux"',
+    'Sec-Fetch-Dest': 'empty',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Site': 'same-origin',
+    'X-Requested-With': 'XMLHttpRequest'
+}
+
+# Serializa la ingesta (descarga completa / actualización) entre hilos de sesión de la app:
+# el append es leer-modificar-reemplazar y la marca de agua debe seguir al CSV
+_ingesta_lock = threading.RLock()
+
 # Días de sorteo de La Primitiva: Lunes=0, Jueves=3, Sábado=5
 DIAS_SORTEO = {0, 3, 5}
 
@@ -28,31 +81,49 @@ def nombre_dia_sorteo(fecha: datetime) -> str:
     nombres = {0: "Lunes", 3: "Jueves", 5: "Sábado"}
     return nombres.get(fecha.weekday(), "Desconocido")
 
+def motivos_rechazo(bolas, c, r):
+    """
+    Motivo de rechazo por sorteo ('' si es válido), evaluado en bloque sobre arrays.
+    `bolas` es (N, 6) y debe venir ya ordenado por fila.
+    """
+    bolas = np.asarray(bolas)
+    motivos = np.select(
+        [
+            ~((bolas >= 1) & (bolas <= 49)).all(axis=1),
+            (np.diff(bolas, axis=1) == 0).any(axis=1),
+            ~((r >= 0) & (r <= 9)),
+            ~((c >= 0) & (c <= 49)),
+        ],
+        ['bolas fuera de rango', 'bolas repetidas', 'reintegro fuera de rango', 'complementario fuera de rango'],
+        default='',
+    )
+    return motivos
+
 def validar_datos(df):
-    """Valida integridad de los datos: rango de números, reintegro, duplicados."""
+    """Valida integridad de los datos: orden canónico, rango de números, bolas distintas, reintegro, duplicados."""
     if df.empty:
         return df
     
     ball_cols = ['n1', 'n2', 'n3', 'n4', 'n5', 'n6']
     initial_len = len(df)
     
-    # Validar rango de números (1-49)
-    for col in ball_cols:
-        df = df[(df[col] >= 1) & (df[col] <= 49)]
+    # Orden canónico n1 < n2 < ... < n6
+    df = df.copy()
+    bolas = np.sort(df[ball_cols].to_numpy(), axis=1)
+    df[ball_cols] = bolas
     
-    # Validar reintegro (0-9)
-    df = df[(df['r'] >= 0) & (df['r'] <= 9)]
-    
-    # Validar complementario (0-49, 0 = no disponible)
-    if 'c' in df.columns:
-        df = df[(df['c'] >= 0) & (df['c'] <= 49)]
+    # Complementario 0 = no disponible
+    c = df['c'].to_numpy() if 'c' in df.columns else np.zeros(len(df))
+    motivos = motivos_rechazo(bolas, c, df['r'].to_numpy())
+    df = df[motivos == '']
     
     # Eliminar duplicados por fecha
     df = df.drop_duplicates(subset='fecha', keep='last')
     
     removed = initial_len - len(df)
     if removed > 0:
-        logger.warning(f"Se eliminaron {removed} registros inválidos o duplicados.")
+        resumen = pd.Series(motivos[motivos != '']).value_counts().to_dict()
+        logger.warning(f"Se eliminaron {removed} registros inválidos o duplicados. Motivos: {resumen}")
     
     return df
 
@@ -63,126 +134,409 @@ def cargar_datos():
         df = pd.DataFrame(columns=['fecha', 'n1', 'n2', 'n3', 'n4', 'n5', 'n6', 'r', 'c'])
         df.to_csv(DATA_PATH, index=False)
     
+    df = _cargar_binario()
+    if df is not None:
+        return df
+
     try:
         df = pd.read_csv(DATA_PATH)
         if df.empty:
             return pd.DataFrame(columns=['fecha', 'n1', 'n2', 'n3', 'n4', 'n5', 'n6', 'r', 'c'])
-        df['fecha'] = pd.to_datetime(df['fecha'])
+        df['fecha'] = pd.to_datetime(df['fecha']).astype('datetime64[ns]')
         df = validar_datos(df)
-        return df.sort_values('fecha').reset_index(drop=True)
+        df = df.sort_values('fecha').reset_index(drop=True)
+        _guardar_binario(df)
+        return df
     except Exception as e:
         logger.error(f"Error cargando datos: {e}")
         return pd.DataFrame(columns=['fecha', 'n1', 'n2', 'n3', 'n4', 'n5', 'n6', 'r', 'c'])
 
-def descargar_historico_completo(progress_callback=None):
+def _firma_csv():
+    """Identifica la versión del CSV fuente (mtime en ns + tamaño)."""
+    st = os.stat(DATA_PATH)
+    return np.array([st.st_mtime_ns, st.st_size], dtype=np.int64)
+
+def _cargar_binario():
+    """
+    Carga el histórico desde la copia binaria columnar si sigue siendo fiel al CSV y a
+    STORE_SCHEMA. Devuelve None si no existe, está obsoleta o es ilegible (se reconstruirá).
+    """
+    if not os.path.exists(STORE_PATH):
+        return None
+    try:
+        with np.load(STORE_PATH) as store:
+            if not _binario_vigente(store, _firma_csv()):
+                return None
+            fechas = store['fecha']
+            cols = {'fecha': fechas.view('datetime64[ns]')}
+            for col in STORE_COLS:
+                cols[col] = store[col].astype(np.int64)
+        return pd.DataFrame(cols)
+    except Exception as e:
+        logger.warning(f"Copia binaria del histórico ilegible, se reconstruye desde CSV: {e}")
+        return None
+
+def _binario_vigente(store, firma):
+    """La copia binaria corresponde al CSV con `firma` y al esquema actual."""
+    return ('schema' in store.files and int(store['schema']) == STORE_SCHEMA
+            and np.array_equal(store['firma'], firma))
+
+def _ruta_temporal(ruta, sufijo='.tmp'):
+    """
+    Fichero temporal único junto a `ruta` (mismo directorio, para que os.replace sea
+    atómico): no colisiona entre procesos ni entre hilos de sesión del mismo proceso.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ruta), prefix=os.path.basename(ruta) + '.', suffix=sufijo)
+    os.close(fd)
+    os.chmod(tmp, 0o644)  # mkstemp crea con 0600; el destino conserva permisos normales
+    return tmp
+
+def _guardar_binario(df):
+    """Guarda el histórico validado como arrays (int64 fechas, int8 bolas) con escritura atómica."""
+    try:
+        os.makedirs(os.path.dirname(STORE_PATH), exist_ok=True)
+        arrays = {
+            'schema': np.int64(STORE_SCHEMA),
+            'firma': _firma_csv(),
+            'fecha': df['fecha'].values.astype('datetime64[ns]').astype(np.int64),
+        }
+        for col in STORE_COLS:
+            arrays[col] = df[col].values.astype(np.int8)
+        tmp = _ruta_temporal(STORE_PATH, '.tmp.npz')
+        try:
+            np.savez(tmp, **arrays)
+            os.replace(tmp, STORE_PATH)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    except Exception as e:
+        logger.warning(f"No se pudo guardar la copia binaria del histórico: {e}")
+
+def descargar_historico_completo(progress_callback=None, max_workers=DESCARGA_WORKERS):
     """Descarga todo el historial desde 1985 hasta la fecha actual"""
+    with _ingesta_lock:
+        return _descargar_historico_completo(progress_callback, max_workers)
+
+def _descargar_historico_completo(progress_callback, max_workers):
     year_actual = datetime.now().year
-    todos_registros = []
     
     print("🔄 Iniciando descarga completa del histórico (1985-Presente)...")
     
     years = range(1985, year_actual + 1)
-    total_years = len(years)
-    
-    for i, year in enumerate(years):
-        if progress_callback:
-            progress_callback(i / total_years, f"Descargando año {year}...")
-            
-        registros_year = descargar_anio(year)
-        todos_registros.extend(registros_year)
+    df, fallidos, rechazos = descargar_anios(years, progress_callback=progress_callback, max_workers=max_workers)
+    aviso_fallidos = f" Años con error: {', '.join(str(y) for y in fallidos)}." if fallidos else ""
+    aviso_rechazos = f" ⚠️ {len(rechazos)} sorteos rechazados por formato." if len(rechazos) else ""
         
-    if todos_registros:
-        df = pd.DataFrame(todos_registros)
+    if fallidos and not df.empty:
+        # Un histórico con huecos no sustituye al actual: la marca de agua apuntaría al
+        # último sorteo y la ingesta incremental nunca rellenaría los años que faltan.
+        # Los años ya descargados quedan en la caché raw, así que reintentar es barato.
+        return (f"⚠️ Descarga incompleta, el histórico no se ha modificado.{aviso_fallidos}"
+                f" Vuelve a intentarlo más tarde.")
+    if not df.empty:
         df = df.drop_duplicates(subset='fecha').sort_values('fecha')
-        df.to_csv(DATA_PATH, index=False)
-        return f"✅ Histórico completo descargado. {len(df)} sorteos registrados."
+        _escribir_csv_atomico(df)
+        return f"✅ Histórico completo descargado. {len(df)} sorteos registrados.{aviso_rechazos}"
     else:
         return "⚠️ No se pudieron descargar datos. Verifica la conexión o el bloqueo del sitio oficial."
 
-def descargar_anio(year):
-    """Descarga los sorteos de un año específico con headers robustos"""
-    url = f"https://www.loteriasyapuestas.es/servicios/buscadorSorteos?game_id=LAPR&celebrados=true&fechaInicioInclusiva={year}0101&fechaFinInclusiva={year}1231"
-    
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-        'Accept': 'application/json, text/plain, */*',
-        'Accept-Language': 'es-ES,es;q=0.9,en;q=0.8',
-        'Referer': 'https://www.loteriasyapuestas.es/es/la-primitiva',
-        'Cache-Control': 'no-cache',
-        'Pragma': 'no-cache',
-        'Sec-Ch-Ua': '"Not A(Brand";v="99", "Google Chrome";v="121", "Chromium";v="121"',
-        'Sec-Ch-Ua-Mobile': '?0',
-        'Sec-Ch-Ua-Platform': '"Linux"',
-        'Sec-Fetch-Dest': 'empty',
-        'Sec-Fetch-Mode': 'cors',
-        'Sec-Fetch-Site': 'same-origin',
-        'X-Requested-With': 'XMLHttpRequest'
-    }
-    
-    registros = []
+def crear_sesion(pool_size=DESCARGA_WORKERS):
+    """Sesión HTTP compartida con un pool de conexiones dimensionado para los workers."""
     session = requests.Session()
-    
+    session.headers.update(HEADERS)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def descargar_anios(years, progress_callback=None, max_workers=DESCARGA_WORKERS,
+                    reintentos=DESCARGA_REINTENTOS, backoff=DESCARGA_BACKOFF):
+    """
+    Descarga varios años en paralelo (concurrencia acotada) sobre una única sesión.
+
+    Devuelve (sorteos, años_fallidos, rechazos). El progress_callback(fraccion, texto)
+    se invoca siempre desde el hilo llamante, a medida que termina cada año.
+    """
+    years = list(years)
+    total_years = len(years)
+    sorteos = []
+    rechazos = []
+    fallidos = []
+
+    session = crear_sesion(pool_size=max(max_workers, 1))
     try:
-        response = session.get(url, headers=headers, timeout=15)
-        if response.status_code == 200:
-            try:
-                data = response.json()
-            except Exception:
-                return []
-                
-            if not data:
-                return []
-            
-            for sorteo in data:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futuros = {
+                pool.submit(_descargar_anio_con_reintentos, session, year, reintentos, backoff): year
+                for year in years
+            }
+            for i, futuro in enumerate(as_completed(futuros), start=1):
+                year = futuros[futuro]
                 try:
-                    fecha_sorteo = datetime.strptime(sorteo['fecha_sorteo'], "%Y-%m-%d %H:%M:%S")
-                    comb = sorteo['combinacion']
-                    
-                    parts = comb.replace('C(', '-').replace(') R(', '-').replace(')', '').split('-')
-                    if len(parts) < 8: 
-                         parts = [x.strip() for x in comb.replace('-', ' ').split() if x.strip().isdigit()]
-
-                    nums = [int(p.strip()) for p in parts if p.strip().isdigit()]
-                    
-                    if len(nums) >= 6:
-                        registro = {
-                            'fecha': fecha_sorteo,
-                            'n1': nums[0], 'n2': nums[1], 'n3': nums[2],
-                            'n4': nums[3], 'n5': nums[4], 'n6': nums[5],
-                            'c': nums[6] if len(nums) > 6 else 0,
-                            'r': nums[7] if len(nums) > 7 else 0
-                        }
-                        registros.append(registro)
-                except Exception:
-                    pass
+                    df_year, rechazos_year = futuro.result()
+                    sorteos.append(df_year)
+                    rechazos.append(rechazos_year)
+                except Exception as e:
+                    logger.warning(f"No se pudo descargar el año {year}: {e}")
+                    fallidos.append(year)
+                if progress_callback:
+                    progress_callback(i / total_years, f"Descargado año {year} ({i}/{total_years})...")
+    finally:
+        session.close()
+
+    df = pd.concat(sorteos, ignore_index=True) if sorteos else parsear_sorteos([])[0]
+    df_rechazos = pd.concat(rechazos, ignore_index=True) if rechazos else parsear_sorteos([])[1]
+    return df, sorted(fallidos), df_rechazos
+
+def _descargar_anio_con_reintentos(session, year, reintentos=DESCARGA_REINTENTOS, backoff=DESCARGA_BACKOFF):
+    """Descarga un año reintentando con backoff exponencial. Lanza la última excepción si se agotan."""
+    return _con_reintentos(_descargar_anio, session, year, reintentos=reintentos, backoff=backoff)
+
+def _con_reintentos(fn, *args, reintentos=DESCARGA_REINTENTOS, backoff=DESCARGA_BACKOFF):
+    """Ejecuta fn(*args) reintentando con backoff exponencial. Lanza la última excepción si se agotan."""
+    for intento in range(reintentos + 1):
+        try:
+            return fn(*args)
+        except Exception:
+            if intento == reintentos:
+                raise
+            time.sleep(backoff * (2 ** intento))
+
+def _descargar_anio(session, year):
+    """Descarga y parsea los sorteos de un año: (df, rechazos). Lanza excepción ante cualquier fallo de red."""
+    data = _obtener_raw_anio(session, year)
+    return parsear_sorteos(data or [])
+
+def _ruta_cache_raw(year):
+    return os.path.join(RAW_CACHE_DIR, f'{year}.json')
+
+def _anio_cerrado(year, fecha):
+    """Un año es inmutable cuando se descargó pasado el periodo de gracia tras su cierre."""
+    return fecha >= datetime(year + 1, 1, 1) + timedelta(days=CACHE_GRACIA_DIAS)
+
+def _leer_cache_raw(year):
+    ruta = _ruta_cache_raw(year)
+    if not os.path.exists(ruta):
+        return None
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Caché del año {year} ilegible, se descargará de nuevo: {e}")
+        return None
+
+def _guardar_cache_raw(year, entrada):
+    """Escritura atómica (fichero temporal + rename) de la respuesta cruda de un año."""
+    os.makedirs(RAW_CACHE_DIR, exist_ok=True)
+    ruta = _ruta_cache_raw(year)
+    tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(entrada, f, ensure_ascii=False)
+    os.replace(tmp, ruta)
+
+def _obtener_raw_anio(session, year):
+    """
+    Devuelve la respuesta cruda de buscadorSorteos para un año, pasando por la caché en disco.
+
+    - Años cerrados (inmutables): se sirven de disco sin tocar la red.
+    - Año en curso: se revalida con If-None-Match / If-Modified-Since si el
+      servidor envió ETag / Last-Modified; un 304 reutiliza la copia local.
+    - Respuesta vacía (p. ej. un 200 transitorio sin cuerpo): nunca se da por inmutable
+      ni se revalida; se vuelve a pedir entera, también si una caché antigua la marcó.
+    """
+    ahora = datetime.now()
+    cache = _leer_cache_raw(year)
+    if cache is not None and cache.get('inmutable') and cache.get('data'):
+        return cache['data']
+
+    url = f"{API_URL}?game_id=LAPR&celebrados=true&fechaInicioInclusiva={year}0101&fechaFinInclusiva={year}1231"
+    headers = {}
+    # Una copia vacía no se revalida: un 304 la perpetuaría
+    if cache is not None and cache.get('data'):
+        if cache.get('etag'):
+            headers['If-None-Match'] = cache['etag']
+        if cache.get('last_modified'):
+            headers['If-Modified-Since'] = cache['last_modified']
+
+    response = session.get(url, headers=headers, timeout=15)
+    if response.status_code == 304 and cache is not None:
+        data = cache['data']
+        etag, last_modified = cache.get('etag'), cache.get('last_modified')
+    else:
+        response.raise_for_status()
+        data = response.json() or []
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+    _guardar_cache_raw(year, {
+        'year': year,
+        'descargado': ahora.isoformat(timespec='seconds'),
+        'inmutable': bool(data) and _anio_cerrado(year, ahora),
+        'etag': etag,
+        'last_modified': last_modified,
+        'data': data,
+    })
+    return data
+
+def parsear_sorteos(data):
+    """
+    Convierte la respuesta JSON de buscadorSorteos en un DataFrame de sorteos en una sola pasada.
+
+    Devuelve (df, rechazos): `df` con fecha, n1..n6 (orden canónico), c, r y `rechazos`
+    con fecha_sorteo, combinacion y motivo de cada registro descartado.
+    """
+    columnas = ['fecha', 'n1', 'n2', 'n3', 'n4', 'n5', 'n6', 'c', 'r']
+    raw = pd.DataFrame(list(data), columns=['fecha_sorteo', 'combinacion'])
+    if raw.empty:
+        return pd.DataFrame(columns=columnas), pd.DataFrame(columns=['fecha_sorteo', 'combinacion', 'motivo'])
+
+    fechas = pd.to_datetime(raw['fecha_sorteo'], format="%Y-%m-%d %H:%M:%S", errors='coerce')
+    nums = raw['combinacion'].astype(str).str.extract(PATRON_COMBINACION).astype(float)
+
+    bolas = nums.iloc[:, :6].to_numpy()
+    legible = ~np.isnan(bolas).any(axis=1)
+    bolas = np.sort(np.nan_to_num(bolas), axis=1).astype(np.int64)
+    c = nums[6].fillna(0).to_numpy().astype(np.int64)
+    r = nums[7].fillna(0).to_numpy().astype(np.int64)
+
+    motivos = np.where(fechas.isna().to_numpy(), 'fecha ilegible',
+                       np.where(~legible, 'combinación ilegible', motivos_rechazo(bolas, c, r)))
+    validos = motivos == ''
+
+    df = pd.DataFrame(bolas[validos], columns=['n1', 'n2', 'n3', 'n4', 'n5', 'n6'])
+    df.insert(0, 'fecha', fechas[validos].to_numpy().astype('datetime64[ns]'))
+    df['c'] = c[validos]
+    df['r'] = r[validos]
+
+    rechazos = raw.loc[~validos, ['fecha_sorteo', 'combinacion']].assign(motivo=motivos[~validos])
+    if not rechazos.empty:
+        logger.warning(f"Se rechazaron {len(rechazos)} sorteos al parsear: {rechazos['motivo'].value_counts().to_dict()}")
+    return df[columnas], rechazos.reset_index(drop=True)
+
+def descargar_anio(year, session=None):
+    """Descarga los sorteos de un año específico con headers robustos"""
+    propia = session is None
+    if propia:
+        session = crear_sesion(pool_size=1)
+    try:
+        df, _ = _descargar_anio(session, year)
+        return df.to_dict('records')
     except Exception:
-        pass
-        
-    return registros
+        return []
+    finally:
+        if propia:
+            session.close()
 
 def actualizar_datos():
-    """Descarga solo los sorteos nuevos desde la última fecha registrada con seguridad"""
-    df = cargar_datos()
-    
-    if not df.empty:
-        ultima_fecha = df.iloc[-1]['fecha']
-        year_inicio = ultima_fecha.year
-    else:
-        return descargar_historico_completo()
+    """
+    Ingesta incremental: descarga solo el rango de fechas posterior a la marca de agua
+    (último sorteo registrado) y anexa los sorteos nuevos validados de forma atómica.
+    Una sola ingesta a la vez: otra sesión que pulse "actualizar" espera y, al entrar,
+    parte de la marca de agua ya avanzada.
+    """
+    with _ingesta_lock:
+        return _actualizar_datos()
 
-    year_actual = datetime.now().year
-    nuevos_registros = []
-
-    for year in range(year_inicio, year_actual + 1):
-        registros_anio = descargar_anio(year)
-        for reg in registros_anio:
-            if reg['fecha'] > ultima_fecha:
-                nuevos_registros.append(reg)
-
-    if nuevos_registros:
-        df_new = pd.DataFrame(nuevos_registros)
-        df_total = pd.concat([df, df_new]).drop_duplicates(subset='fecha').sort_values('fecha')
-        df_total.to_csv(DATA_PATH, index=False)
-        return f"✅ Se han añadido {len(nuevos_registros)} nuevos sorteos."
-    else:
-        return "✨ Los datos ya están actualizados o no se han encontrado nuevos sorteos."
\ No newline at end of file
+def _actualizar_datos():
+    ultima_fecha = _leer_marca_agua()
+    if ultima_fecha is None:
+        df = cargar_datos()
+        if df.empty:
+            return descargar_historico_completo()
+        ultima_fecha = df.iloc[-1]['fecha'].to_pydatetime()
+
+    desde = (ultima_fecha + timedelta(days=1)).date()
+    hasta = datetime.now().date()
+    if desde > hasta:
+        return "✨ Los datos ya están actualizados o no se han encontrado nuevos sorteos."
+
+    session = crear_sesion(pool_size=1)
+    try:
+        df_rango, _ = _con_reintentos(_descargar_rango, session, desde, hasta)
+    except Exception as e:
+        logger.warning(f"No se pudo consultar el rango {desde} - {hasta}: {e}")
+        return "⚠️ No se pudo conectar con el sitio oficial. Inténtalo más tarde."
+    finally:
+        session.close()
+
+    df_new = validar_datos(df_rango[df_rango['fecha'] > ultima_fecha]).sort_values('fecha')
+    if df_new.empty:
+        return "✨ Los datos ya están actualizados o no se han encontrado nuevos sorteos."
+    _anexar_sorteos(df_new)
+    return f"✅ Se han añadido {len(df_new)} nuevos sorteos."
+
+def _descargar_rango(session, desde, hasta):
+    """Descarga (sin caché) los sorteos celebrados entre dos fechas inclusivas."""
+    url = (f"{API_URL}?game_id=LAPR&celebrados=true"
+           f"&fechaInicioInclusiva={desde:%Y%m%d}&fechaFinInclusiva={hasta:%Y%m%d}")
+    response = session.get(url, timeout=15)
+    response.raise_for_status()
+    return parsear_sorteos(response.json() or [])
+
+def _escribir_csv_atomico(df):
+    """Reescribe el histórico completo vía fichero temporal + rename (los lectores nunca ven un CSV a medias)."""
+    tmp = _ruta_temporal(DATA_PATH)
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, DATA_PATH)
+    _guardar_marca_agua(pd.Timestamp(df['fecha'].max()).to_pydatetime())
+
+def _anexar_sorteos(df_new):
+    """
+    Anexa sorteos nuevos (posteriores al último registrado) sin reparsear el histórico:
+    copia de bytes del CSV actual + append + rename atómico. La copia binaria y la
+    marca de agua se actualizan a continuación.
+    """
+    firma_anterior = _firma_csv()
+    with open(DATA_PATH, 'r', encoding='utf-8') as f:
+        cabecera = f.readline().strip().split(',')
+
+    tmp = _ruta_temporal(DATA_PATH)
+    shutil.copyfile(DATA_PATH, tmp)
+    with open(tmp, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+        f.write(df_new.reindex(columns=cabecera).to_csv(
+            index=False, header=False, date_format='%Y-%m-%d %H:%M:%S').encode('utf-8'))
+    os.replace(tmp, DATA_PATH)
+
+    _anexar_binario(df_new, firma_anterior)
+    _guardar_marca_agua(pd.Timestamp(df_new['fecha'].max()).to_pydatetime())
+
+def _anexar_binario(df_new, firma_anterior):
+    """Extiende la copia binaria si estaba al día con el CSV previo; si no, se reconstruirá al cargar."""
+    try:
+        with np.load(STORE_PATH) as store:
+            if not _binario_vigente(store, firma_anterior):
+                return
+            previo = {k: store[k] for k in ['fecha'] + STORE_COLS}
+    except Exception:
+        return
+    df_total = pd.DataFrame({
+        'fecha': np.concatenate([previo['fecha'].view('datetime64[ns]'),
+                                 df_new['fecha'].values.astype('datetime64[ns]')]),
+        **{col: np.concatenate([previo[col], df_new[col].values.astype(np.int8)]) for col in STORE_COLS},
+    })
+    _guardar_binario(df_total)
+
+def _leer_marca_agua():
+    """Fecha del último sorteo ingerido, si la marca corresponde a la versión actual del CSV."""
+    if not os.path.exists(MARCA_AGUA_PATH) or not os.path.exists(DATA_PATH):
+        return None
+    try:
+        with open(MARCA_AGUA_PATH, 'r', encoding='utf-8') as f:
+            marca = json.load(f)
+        if marca.get('firma') != _firma_csv().tolist():
+            return None
+        return datetime.fromisoformat(marca['ultima_fecha'])
+    except Exception:
+        return None
+
+def _guardar_marca_agua(ultima_fecha):
+    os.makedirs(os.path.dirname(MARCA_AGUA_PATH), exist_ok=True)
+    tmp = _ruta_temporal(MARCA_AGUA_PATH)
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'ultima_fecha': ultima_fecha.isoformat(), 'firma': _firma_csv().tolist()}, f)
+    os.replace(tmp, MARCA_AGUA_PATH)
@@ -0,0 +1,240 @@
+# src/expected_value.py
+"""
+Optimizador de valor esperado (EV) sobre las 13.983.816 combinaciones (mejoras v3, §2.4).
+
+Todas las combinaciones tienen la misma probabilidad de acertar; lo que cambia es
+con cuántos otros acertantes se reparte el bote. Un modelo de popularidad asigna a
+cada combinación un peso relativo de ser elegida por un jugador humano (cumpleaños,
+múltiplos de 7, números "bonitos", secuencias y patrones). Con `apuestas` boletos
+vendidos, el número de otros acertantes es ~ Poisson(λ), λ = apuestas · w(c) / Σw, y
+la fracción esperada del bote es E[1 / (1 + X)] = (1 - e^(-λ)) / λ.
+
+El EV es decreciente en w(c), así que el top-K por EV son las K combinaciones menos
+populares: el espacio se recorre una sola vez, en bloques de memoria acotada
+(src/combinations.py) repartidos en un pool de procesos, guardando el top-K local de
+cada bloque y la suma parcial de pesos. El modelo es una suma de pocos términos, así
+que hay muchas combinaciones con el mismo peso: el top-K desempata en orden colex y,
+con `ties`, se amplía con toda la clase empatada con la K-ésima.
+"""
+import os
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from math import comb
+
+import numpy as np
+
+from src.combinations import (INDEX_DIR, N_COMBINATIONS, _colex_table, combination_block,
+                               game_theory_block_filter, game_theory_signature)
+
+# ── Modelo de popularidad (log-pesos relativos) ──
+BIRTHDAY_MAX = 31
+LOG_W_BIRTHDAY = np.log(2.0)           # 1-31 se eligen ~2x más (fechas)
+MULTIPLES_OF_7 = (7, 14, 21, 28, 35, 42, 49)
+LOG_W_MULTIPLE_7 = np.log(1.5)
+LUCKY_NUMBERS = (1, 3, 7, 11, 13, 17, 21, 33)
+LOG_W_LUCKY = np.log(1.4)
+LOG_W_ALL_DATES = np.log(3.0)          # Boleto entero de fechas (todas ≤ 31)
+LOG_W_CONSECUTIVE = np.log(1.6)        # Por cada par consecutivo
+LOG_W_PROGRESSION = np.log(50.0)       # Progresión aritmética (5-10-15-20-25-30...)
+LOG_W_SAME_ENDING = np.log(4.0)        # ≥ 4 números con la misma terminación
+LOG_W_SAME_DECADE = np.log(4.0)        # ≥ 4 números en la misma decena
+
+# ── Estructura de premios (estimación, mejoras v3 §4.2) ──
+BOTE_DEFAULT = 1_000_000
+APUESTAS_DEFAULT = 5_000_000
+COSTE_BOLETO = 1.0
+PREMIOS_MENORES = {3: 8, 4: 60, 5: 2000}
+
+TOP_K_DEFAULT = 1000
+TIE_TOL = 1e-9                         # Log-pesos a menos de TIE_TOL se consideran empatados
+
+_top_lock = threading.Lock()
+_top_cache = {}
+
+
+def ball_log_weights():
+    """Log-peso de popularidad por bola (vector de 49)."""
+    w = np.zeros(49)
+    w[:BIRTHDAY_MAX] += LOG_W_BIRTHDAY
+    w[np.array(MULTIPLES_OF_7) - 1] += LOG_W_MULTIPLE_7
+    w[np.array(LUCKY_NUMBERS) - 1] += LOG_W_LUCKY
+    return w
+
+
+def popularity_log_weights(balls, ball_w=None):
+    """Log-peso de popularidad de cada fila (K, 6), ordenada, según el modelo del módulo."""
+    if ball_w is None:
+        ball_w = ball_log_weights()
+    balls = np.asarray(balls, dtype=np.int16)
+    log_w = ball_w[balls - 1].sum(axis=1)
+
+    log_w += LOG_W_ALL_DATES * (balls[:, -1] <= BIRTHDAY_MAX)
+
+    diffs = np.diff(balls, axis=1)
+    log_w += LOG_W_CONSECUTIVE * (diffs == 1).sum(axis=1)
+    log_w += LOG_W_PROGRESSION * (diffs == diffs[:, :1]).all(axis=1)
+
+    # Con valores ordenados, "≥ 4 iguales" equivale a una ventana de 4 con extremos iguales
+    endings = np.sort(balls % 10, axis=1)
+    log_w += LOG_W_SAME_ENDING * (endings[:, 3:] == endings[:, :3]).any(axis=1)
+
+    decades = balls // 10  # Ya ordenadas (filas ordenadas)
+    log_w += LOG_W_SAME_DECADE * (decades[:, 3:] == decades[:, :3]).any(axis=1)
+    return log_w
+
+
+def _row_counts(values, n_values):
+    """Conteo por fila de cada valor 0..n_values-1 en `values` (K, c), como int8 (K, n_values)."""
+    counts = np.zeros(len(values) * n_values, dtype=np.int8)
+    base = np.arange(len(values)) * n_values
+    for col in values.T:  # Dentro de una columna cada fila escribe en su propia celda
+        counts[base + col] += 1
+    return counts.reshape(len(values), n_values)
+
+
+@lru_cache(maxsize=None)
+def _prefix_popularity():
+    """Términos del modelo sobre la tabla colex de 5 (prefijos compartidos por todos los bloques)."""
+    prefix = _colex_table(5).astype(np.int16)
+    diffs = np.diff(prefix, axis=1)
+    # Cuántos números del prefijo hay por terminación (0-9) y por decena (0-4)
+    endings = _row_counts(prefix % 10, 10)
+    decades = _row_counts(prefix // 10, 5)
+    return {
+        'log_w': ball_log_weights()[prefix - 1].sum(axis=1),
+        'last': prefix[:, -1],
+        'consecutives': (diffs == 1).sum(axis=1),
+        'step': np.where((diffs == diffs[:, :1]).all(axis=1), diffs[:, 0], 0),
+        'endings': endings,
+        'max_ending': endings.max(axis=1),
+        'decades': decades,
+        'max_decade': decades.max(axis=1),
+    }
+
+
+def block_log_weights(m):
+    """
+    popularity_log_weights de combination_block(m), de forma incremental: cada fila es
+    un prefijo de 5 (términos precalculados) más la bola mayor m.
+    """
+    rows = comb(m - 1, 5)
+    pre = {k: v[:rows] for k, v in _prefix_popularity().items()}
+    log_w = pre['log_w'] + ball_log_weights()[m - 1]
+    if m <= BIRTHDAY_MAX:
+        log_w += LOG_W_ALL_DATES
+    log_w += LOG_W_CONSECUTIVE * (pre['consecutives'] + (pre['last'] == m - 1))
+    log_w += LOG_W_PROGRESSION * ((pre['step'] > 0) & (m - pre['last'] == pre['step']))
+    same_ending = (pre['max_ending'] >= 4) | (pre['endings'][:, m % 10] >= 3)
+    log_w += LOG_W_SAME_ENDING * same_ending
+    same_decade = (pre['max_decade'] >= 4) | (pre['decades'][:, m // 10] >= 3)
+    log_w += LOG_W_SAME_DECADE * same_decade
+    return log_w
+
+
+def jackpot_share(lam):
+    """Fracción esperada del bote con X ~ Poisson(λ) otros acertantes: (1 - e^(-λ)) / λ."""
+    lam = np.asarray(lam, dtype=float)
+    safe = np.where(lam > 0, lam, 1.0)
+    return np.where(lam > 0, -np.expm1(-safe) / safe, 1.0)
+
+
+def minor_prizes_ev():
+    """EV de las categorías menores (premio fijo estimado), igual para todas las combinaciones."""
+    ev = 0.0
+    for aciertos, premio in PREMIOS_MENORES.items():
+        p = comb(6, aciertos) * comb(43, 6 - aciertos) / N_COMBINATIONS
+        ev += p * premio
+    return ev
+
+
+def expected_value(log_w, log_z, bote=BOTE_DEFAULT, apuestas=APUESTAS_DEFAULT):
+    """EV por boleto de combinaciones con log-peso `log_w`, siendo `log_z` = log Σw del espacio."""
+    lam = apuestas * np.exp(np.asarray(log_w) - log_z)
+    return (bote * jackpot_share(lam) / N_COMBINATIONS + minor_prizes_ev() - COSTE_BOLETO)
+
+
+def _score_block(args):
+    """
+    Tarea del pool: top-K (menor log-peso) de un bloque, ampliado con los empatados con
+    el K-ésimo (así el corte global puede desempatar en orden colex), y su Σw parcial.
+    """
+    m, k, valid_only = args
+    log_w = block_log_weights(m)
+    total = float(np.exp(log_w).sum())
+    keep = np.flatnonzero(game_theory_block_filter(m)) if valid_only else np.arange(len(log_w))
+    if len(keep) > k:
+        cutoff = np.partition(log_w[keep], k - 1)[k - 1]
+        keep = keep[log_w[keep] <= cutoff + TIE_TOL]  # Sigue en orden colex
+    return combination_block(m)[keep], log_w[keep], total
+
+
+def search_top_ev(k=TOP_K_DEFAULT, valid_only=False, workers=None, ties=False):
+    """
+    Recorre el espacio completo y devuelve (balls (k, 6), log_w (k,), log_z): las k
+    combinaciones de menor popularidad (mayor EV), de mejor a peor y a igual peso en
+    orden colex, y log Σw sobre las 13.983.816 combinaciones. Con `ties` se devuelven
+    además todas las empatadas con la k-ésima (≥ k filas). Con `valid_only` solo
+    compiten las que cumplen las reglas de engine_game_theory (Σw sigue siendo el del
+    espacio completo).
+    """
+    workers = workers or os.cpu_count() or 1
+    tasks = [(m, k, valid_only) for m in range(6, 50)]
+    if workers > 1:
+        # Los bloques mayores primero: reparto más equilibrado entre procesos
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_score_block, tasks[::-1]))[::-1]
+    else:
+        results = [_score_block(t) for t in tasks]
+
+    balls = np.concatenate([r[0] for r in results])
+    log_w = np.concatenate([r[1] for r in results])
+    log_z = float(np.log(sum(r[2] for r in results)))
+    order = np.argsort(log_w, kind='stable')  # Bloques concatenados en orden colex
+    if not ties:
+        order = order[:k]
+    elif len(order) > k:
+        order = order[log_w[order] <= log_w[order[k - 1]] + TIE_TOL]
+    return balls[order], log_w[order], log_z
+
+
+def _top_path(k, valid_only):
+    modelo = repr((BIRTHDAY_MAX, LOG_W_BIRTHDAY, MULTIPLES_OF_7, LOG_W_MULTIPLE_7, LUCKY_NUMBERS,
+                   LOG_W_LUCKY, LOG_W_ALL_DATES, LOG_W_CONSECUTIVE, LOG_W_PROGRESSION,
+                   LOG_W_SAME_ENDING, LOG_W_SAME_DECADE, k, valid_only, 'empates', TIE_TOL))
+    if valid_only:
+        modelo += f'{game_theory_signature():08x}'
+    return os.path.join(INDEX_DIR, f'top_ev_{zlib.crc32(modelo.encode()):08x}.npz')
+
+
+def top_ev_tickets(k=TOP_K_DEFAULT, valid_only=False, bote=BOTE_DEFAULT,
+                   apuestas=APUESTAS_DEFAULT, workers=None, ties=False):
+    """
+    Top-k boletos por EV como (balls (k, 6) int8, ev (k,)), de mejor a peor (a igual EV,
+    en orden colex). Con `ties`, más todas las combinaciones empatadas con la k-ésima.
+    La búsqueda (independiente del bote y de las apuestas) se hace una vez por modelo de
+    popularidad y se guarda en data/cache; el EV se recalcula para `bote` y `apuestas`.
+    """
+    key = (k, valid_only)
+    with _top_lock:
+        if key not in _top_cache:
+            path = _top_path(k, valid_only)
+            try:
+                with np.load(path) as store:
+                    _top_cache[key] = (store['balls'], store['log_w'], float(store['log_z']))
+            except (OSError, ValueError, KeyError):
+                # Se guarda la clase empatada completa: sirve para ambos valores de `ties`
+                balls, log_w, log_z = search_top_ev(k, valid_only=valid_only, workers=workers, ties=True)
+                try:
+                    os.makedirs(INDEX_DIR, exist_ok=True)
+                    tmp = f"{path}.{os.getpid()}.tmp.npz"
+                    np.savez(tmp, balls=balls, log_w=log_w, log_z=log_z)
+                    os.replace(tmp, path)
+                except OSError:
+                    pass
+                _top_cache[key] = (balls, log_w, log_z)
+        balls, log_w, log_z = _top_cache[key]
+    if not ties:
+        balls, log_w = balls[:k], log_w[:k]
+    return balls, expected_value(log_w, log_z, bote=bote, apuestas=apuestas)
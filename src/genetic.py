@@ -0,0 +1,232 @@
+# src/genetic.py
+"""
+Algoritmo genético vectorizado sobre combinaciones de 6 números (1-49).
+
+La población es un array int8 (P, 6) con cada fila ordenada. La fitness se evalúa
+en bloque a partir de un vector de 49 scores por bola más penalizaciones
+estructurales (suma, consecutivos, diversidad de décadas), y cada individuo se
+evalúa una sola vez: la fitness de la élite se arrastra entre generaciones y los
+torneos la reutilizan a través del ranking.
+
+`evolve` es el camino de un solo proceso (simulación, backtesting); `evolve_islands`
+reparte varias poblaciones en un pool de procesos con migración periódica de élites
+y parada por convergencia, para búsquedas más profundas en la predicción en vivo.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+SUM_RANGE = (115, 185)
+
+
+def fitness(population, ball_scores):
+    """
+    Fitness de cada fila de `population` (P, 6), ordenada ascendentemente:
+    suma de `ball_scores` (vector de 49) + penalización por suma fuera de rango
+    + penalización por consecutivos excesivos + bonus por décadas distintas.
+    """
+    pop = np.asarray(population, dtype=np.int64)
+    score = np.asarray(ball_scores, dtype=float)[pop - 1].sum(axis=1)
+
+    s = pop.sum(axis=1)
+    s_penalty = np.where((s >= SUM_RANGE[0]) & (s <= SUM_RANGE[1]), 0.0, -0.8)
+
+    consecutives = (np.diff(pop, axis=1) == 1).sum(axis=1)
+    c_penalty = -0.3 * np.maximum(consecutives - 1, 0)
+
+    # Filas ordenadas → décadas no decrecientes: décadas distintas = 1 + cambios
+    decades = (pop - 1) // 7
+    diversity_bonus = (1 + (np.diff(decades, axis=1) != 0).sum(axis=1)) * 0.05
+
+    return score + s_penalty + c_penalty + diversity_bonus
+
+
+def random_population(size, rng):
+    """`size` combinaciones uniformes de 6 números distintos, filas ordenadas."""
+    keys = rng.random((size, 49))
+    picks = np.argpartition(keys, 6, axis=1)[:, :6] + 1
+    return np.sort(picks, axis=1).astype(np.int8)
+
+
+def _complete(genes, rng):
+    """
+    Convierte genes (K, 6) con posibles repetidos en combinaciones válidas:
+    conserva los números distintos y rellena al azar hasta 6 (one-hot + top-6 aleatorio).
+    """
+    k = len(genes)
+    onehot = np.zeros((k, 49), dtype=bool)
+    np.put_along_axis(onehot, genes.astype(np.intp) - 1, True, axis=1)
+    # Los genes presentes (≥ 1) siempre superan a cualquier relleno (< 0.5)
+    keys = onehot + rng.random((k, 49)) * 0.5
+    picks = np.argpartition(-keys, 6, axis=1)[:, :6] + 1
+    return np.sort(picks, axis=1).astype(np.int8)
+
+
+def _tournament(n, pool_size, rng, size=3):
+    """
+    Índices ganadores de n torneos de `size` individuos distintos del pool.
+    El pool está ordenado por fitness descendente: gana el índice menor.
+    """
+    size = min(size, pool_size)
+    entrants = np.argpartition(rng.random((n, pool_size)), size - 1, axis=1)[:, :size]
+    return entrants.min(axis=1)
+
+
+def next_generation(population, fit, ball_scores, mutation_rate, rng):
+    """
+    Una generación: ordena por fitness, conserva el 20% de élite y completa con
+    hijos (torneo de 3, crossover de 2 puntos, mutación). Devuelve (población, fitness)
+    con la élite en cabeza y ordenada.
+    """
+    pop_size = len(population)
+    order = np.argsort(-fit, kind='stable')
+    population, fit = population[order], fit[order]
+
+    elite_size = max(pop_size // 5, 2)
+    n_children = pop_size - elite_size
+    if n_children <= 0:
+        return population, fit
+
+    pool_size = min(max(elite_size, 10), pop_size)
+    parent1 = population[_tournament(n_children, pool_size, rng)]
+    parent2 = population[_tournament(n_children, pool_size, rng)]
+
+    # Crossover de 2 puntos: [0, cp1) y [cp2, 6) de parent1, [cp1, cp2) de parent2
+    cuts = np.sort(np.argpartition(rng.random((n_children, 6)), 2, axis=1)[:, :2], axis=1)
+    pos = np.arange(6)
+    from_p2 = (pos >= cuts[:, :1]) & (pos < cuts[:, 1:])
+    children = _complete(np.where(from_p2, parent2, parent1), rng)
+
+    # Mutación: un gen al azar pasa a un número nuevo si no está ya en el hijo
+    mutate = rng.random(n_children) < mutation_rate
+    idx = rng.integers(0, 6, n_children)
+    new_n = rng.integers(1, 50, n_children).astype(np.int8)
+    mutate &= ~(children == new_n[:, None]).any(axis=1)
+    rows = np.flatnonzero(mutate)
+    if len(rows):
+        children[rows, idx[rows]] = new_n[rows]
+        children[rows] = np.sort(children[rows], axis=1)
+
+    population = np.concatenate([population[:elite_size], children])
+    fit = np.concatenate([fit[:elite_size], fitness(children, ball_scores)])
+    return population, fit
+
+
+def _mutation_rate(gen, total):
+    """Mutación adaptativa: más alta al principio, menos al final."""
+    return 0.15 * (1 - min(gen / total, 1.0)) + 0.03
+
+
+def _run_generations(population, fit, ball_scores, start, stop, total, rng):
+    for gen in range(start, stop):
+        population, fit = next_generation(population, fit, ball_scores,
+                                          _mutation_rate(gen, total), rng)
+    return population, fit
+
+
+def evolve(ball_scores, generations=80, pop_size=150, rng=None, population=None):
+    """
+    Evoluciona una población durante `generations` generaciones con mutación adaptativa
+    (más alta al principio, menos al final). Devuelve (población, fitness); las primeras
+    filas son la élite de la última generación, de mejor a peor.
+    """
+    rng = np.random.default_rng(rng)
+    if population is None:
+        population = random_population(pop_size, rng)
+    fit = fitness(population, ball_scores)
+    return _run_generations(population, fit, ball_scores, 0, generations, generations, rng)
+
+
+def _island_epoch(args):
+    """Tarea del pool: avanza una isla de `start` a `stop` y devuelve su estado (incluido el RNG)."""
+    population, fit, ball_scores, start, stop, total, rng = args
+    population, fit = _run_generations(population, fit, ball_scores, start, stop, total, rng)
+    return population, fit, rng
+
+
+def _migrate(islands, n_migrants):
+    """Migración en anillo: la élite de cada isla sustituye a los peores de la siguiente."""
+    elites = []
+    for population, fit, _ in islands:
+        top = np.argsort(-fit, kind='stable')[:n_migrants]
+        elites.append((population[top], fit[top]))
+
+    migrated = []
+    for i, (population, fit, rng) in enumerate(islands):
+        incoming, incoming_fit = elites[i - 1]
+        worst = np.argsort(fit, kind='stable')[:len(incoming)]
+        population, fit = population.copy(), fit.copy()
+        population[worst], fit[worst] = incoming, incoming_fit
+        migrated.append((population, fit, rng))
+    return migrated
+
+
+def evolve_islands(ball_scores, n_islands=None, pop_size=150, max_generations=2000,
+                   migration_interval=20, n_migrants=5, patience=5, tol=1e-9,
+                   time_budget=None, workers=None, seed=None):
+    """
+    Modelo de islas: `n_islands` poblaciones evolucionan en paralelo (un proceso por
+    isla hasta `workers`) y cada `migration_interval` generaciones intercambian sus
+    `n_migrants` mejores individuos en anillo.
+
+    Se detiene al alcanzar `max_generations`, al agotar `time_budget` segundos (se
+    comprueba en cada migración) o cuando la mejor fitness global no mejora más de
+    `tol` durante `patience` migraciones seguidas. Con `workers=1` todo corre en el
+    proceso actual. Con la misma `seed` y sin `time_budget` el resultado es reproducible.
+
+    La mutación se templa sobre las generaciones que se espera completar: con
+    `time_budget`, tras cada migración se estima a partir del ritmo medido, así que
+    la tasa baja hasta su mínimo aunque el presupuesto corte mucho antes de
+    `max_generations`.
+
+    Devuelve (población, fitness, generaciones) con todas las islas juntas, de mejor a peor.
+    """
+    workers = workers or os.cpu_count() or 1
+    n_islands = n_islands or max(workers, 2)
+    ball_scores = np.asarray(ball_scores, dtype=float)
+    started = time.monotonic()
+    deadline = None if time_budget is None else started + time_budget
+
+    rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(n_islands)]
+    islands = []
+    for rng in rngs:
+        population = random_population(pop_size, rng)
+        islands.append((population, fitness(population, ball_scores), rng))
+
+    pool = ProcessPoolExecutor(max_workers=min(workers, n_islands)) if workers > 1 else None
+    best = -np.inf
+    stale = 0
+    gen = 0
+    expected = max_generations
+    try:
+        while gen < max_generations:
+            stop = min(gen + migration_interval, max_generations)
+            tasks = [(population, fit, ball_scores, gen, stop, expected, rng)
+                     for population, fit, rng in islands]
+            islands = list(pool.map(_island_epoch, tasks) if pool else map(_island_epoch, tasks))
+            gen = stop
+            if deadline is not None:
+                now = time.monotonic()
+                per_gen = (now - started) / gen
+                remaining = max(deadline - now, 0.0) / per_gen if per_gen > 0 else max_generations
+                expected = int(min(max_generations, gen + remaining))
+
+            epoch_best = max(fit.max() for _, fit, _ in islands)
+            if epoch_best > best + tol:
+                best, stale = epoch_best, 0
+            else:
+                stale += 1
+            if stale >= patience or (deadline is not None and time.monotonic() >= deadline):
+                break
+
+            islands = _migrate(islands, n_migrants)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    population = np.concatenate([p for p, _, _ in islands])
+    fit = np.concatenate([f for _, f, _ in islands])
+    order = np.argsort(-fit, kind='stable')
+    return population[order], fit[order], gen
@@ -0,0 +1,561 @@
+# src/history.py
+"""
+Representación compacta y de solo lectura del histórico de sorteos.
+
+DrawHistory se construye una vez por dataset y es el sustrato común de todos los
+engines: bolas como array contiguo int8 (N, 6), una máscara de 49 bits por sorteo
+(uint64), complementario y reintegro como int8 y fechas como int64 (ns).
+Los prefijos (`history.prefix(i)`) comparten los mismos arrays, por lo que un paso
+de walk-forward no copia datos.
+"""
+import threading
+import zlib
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+BALL_COLS = ['n1', 'n2', 'n3', 'n4', 'n5', 'n6']
+
+# Fecha a partir de la cual el reintegro es fiable en La Primitiva
+REINTEGRO_VALID_FROM = '2004-01-01'
+_REINTEGRO_VALID_FROM_NS = np.datetime64(REINTEGRO_VALID_FROM, 'ns').astype(np.int64)
+
+# Sin fechas, el reintegro se considera fiable desde un índice fijo: los sorteos pre-2004
+# del histórico oficial (que empieza el 17/10/1985). Fijo y no relativo al final, para que
+# todos los prefijos de un histórico coincidan en qué sorteos cuentan (DrawStats incremental)
+REINTEGRO_FALLBACK_START = 1618
+
+_NAT = np.iinfo(np.int64).min
+
+
+def balls_to_masks(balls):
+    """Convierte un array (N, 6) de bolas 1-49 en máscaras uint64 de 49 bits."""
+    bits = np.left_shift(np.uint64(1), np.asarray(balls, dtype=np.uint64) - np.uint64(1))
+    return np.bitwise_or.reduce(bits, axis=1)
+
+
+def masks_to_balls(masks, k=6):
+    """Inversa de balls_to_masks: máscaras de k bits → array (N, k) int8 de bolas ordenadas."""
+    masks = np.asarray(masks, dtype=np.uint64)
+    bits = (masks[:, None] >> np.arange(49, dtype=np.uint64)) & np.uint64(1)
+    _, cols = np.nonzero(bits)
+    return (cols.reshape(len(masks), k) + 1).astype(np.int8)
+
+
+def balls_to_onehot(balls, dtype=np.float32):
+    """Convierte un array (N, 6) de bolas 1-49 en una matriz de incidencia (N, 49)."""
+    balls = np.asarray(balls)
+    onehot = np.zeros((len(balls), 49), dtype=dtype)
+    np.put_along_axis(onehot, balls.astype(np.intp) - 1, 1, axis=1)
+    return onehot
+
+
+def _read_only(arr):
+    arr.flags.writeable = False
+    return arr
+
+
+class DrawStats:
+    """
+    Estadísticos suficientes por número (1-49) y por reintegro (0-9), ampliables
+    sorteo a sorteo en O(1): apariciones, último índice visto y suma, número y suma
+    de cuadrados de los gaps entre apariciones consecutivas.
+
+    Los índices del reintegro cuentan solo sorteos con reintegro fiable.
+    """
+
+    _FIELDS = ('counts', 'last_idx', 'gap_sum', 'gap_count', 'gap_sq',
+               'r_counts', 'r_last_idx', 'r_gap_sum', 'r_gap_count', 'r_gap_sq')
+
+    def __init__(self):
+        self.n = 0
+        self.r_n = 0
+        self.counts = np.zeros(49, dtype=np.int64)
+        self.last_idx = np.full(49, -1, dtype=np.int64)
+        self.gap_sum = np.zeros(49, dtype=np.int64)
+        self.gap_count = np.zeros(49, dtype=np.int64)
+        self.gap_sq = np.zeros(49, dtype=np.int64)
+        self.r_counts = np.zeros(10, dtype=np.int64)
+        self.r_last_idx = np.full(10, -1, dtype=np.int64)
+        self.r_gap_sum = np.zeros(10, dtype=np.int64)
+        self.r_gap_count = np.zeros(10, dtype=np.int64)
+        self.r_gap_sq = np.zeros(10, dtype=np.int64)
+
+    @classmethod
+    def from_history(cls, history):
+        """Construcción vectorizada (una pasada) sobre un DrawHistory."""
+        stats = cls()
+        stats.n = len(history)
+        stats._fill(history.balls.astype(np.int64) - 1, 49, 'counts', 'last_idx', 'gap_sum', 'gap_count', 'gap_sq')
+        r_valid = history.r[history.reintegro_start():].astype(np.int64)
+        stats.r_n = len(r_valid)
+        stats._fill(r_valid[:, None], 10, 'r_counts', 'r_last_idx', 'r_gap_sum', 'r_gap_count', 'r_gap_sq')
+        return stats
+
+    def _fill(self, values, size, counts, last_idx, gap_sum, gap_count, gap_sq):
+        if not len(values):
+            return
+        onehot = np.zeros((len(values), size), dtype=bool)
+        onehot[np.arange(len(values))[:, None], values] = True
+        # nonzero sobre la traspuesta → pares (valor, índice) ordenados por valor y luego por índice
+        val, idx = np.nonzero(onehot.T)
+        same = np.diff(val) == 0
+        gaps = np.diff(idx)[same]
+        gap_val = val[1:][same]
+        first = np.full(size, -1, dtype=np.int64)
+        last = np.full(size, -1, dtype=np.int64)
+        first[val[::-1]] = idx[::-1]
+        last[val] = idx
+        setattr(self, counts, np.bincount(val, minlength=size).astype(np.int64))
+        setattr(self, last_idx, last)
+        setattr(self, gap_sum, np.where(last >= 0, last - first, 0))
+        setattr(self, gap_count, np.bincount(gap_val, minlength=size).astype(np.int64))
+        setattr(self, gap_sq, np.bincount(gap_val, weights=gaps.astype(np.float64) ** 2, minlength=size).astype(np.int64))
+
+    def append(self, balls, r=0, r_valid=True):
+        """Añade un sorteo (6 bolas 1-49, reintegro) en O(1)."""
+        idx = np.asarray(balls, dtype=np.int64) - 1
+        prev = self.last_idx[idx]
+        seen = prev >= 0
+        gaps = self.n - prev[seen]
+        self.gap_sum[idx[seen]] += gaps
+        self.gap_count[idx[seen]] += 1
+        self.gap_sq[idx[seen]] += gaps * gaps
+        self.counts[idx] += 1
+        self.last_idx[idx] = self.n
+        self.n += 1
+        if r_valid:
+            r = int(r)
+            prev_r = self.r_last_idx[r]
+            if prev_r >= 0:
+                gap = self.r_n - prev_r
+                self.r_gap_sum[r] += gap
+                self.r_gap_count[r] += 1
+                self.r_gap_sq[r] += gap * gap
+            self.r_counts[r] += 1
+            self.r_last_idx[r] = self.r_n
+            self.r_n += 1
+
+    def extend(self, history, start):
+        """Añade los sorteos [start, len(history)) de un histórico."""
+        r_start = history.reintegro_start()
+        balls, r = history.balls, history.r
+        for i in range(start, len(history)):
+            self.append(balls[i], r[i], r_valid=i >= r_start)
+
+    def copy(self):
+        other = DrawStats()
+        other.n, other.r_n = self.n, self.r_n
+        for field in self._FIELDS:
+            setattr(other, field, getattr(self, field).copy())
+        return other
+
+    def lag(self):
+        """Sorteos transcurridos desde la última aparición de cada número (n si nunca apareció)."""
+        return np.where(self.last_idx >= 0, self.n - self.last_idx - 1, self.n)
+
+    def mean_gap(self):
+        """Ciclo medio entre apariciones (NaN si hay menos de 2 apariciones)."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.gap_count > 0, self.gap_sum / np.maximum(self.gap_count, 1), np.nan)
+
+    def r_lag(self):
+        """Lag de cada reintegro en sorteos con reintegro fiable (r_n si nunca apareció)."""
+        return np.where(self.r_last_idx >= 0, self.r_n - self.r_last_idx - 1, self.r_n)
+
+
+class TransitionCounts:
+    """
+    Matriz de transición de Markov de 1er orden (bola del sorteo i → bola del sorteo i+1)
+    con el peso de recencia 1 + 2·i/n factorizado en dos partes independientes de n:
+
+        T = A + (2 / n) · B,   A = Σ_i onehot_iᵀ·onehot_{i+1},   B = Σ_i i·onehot_iᵀ·onehot_{i+1}
+
+    Así añadir un sorteo solo suma 36 celdas en A y B, aunque n cambie.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.unweighted = np.zeros((49, 49))
+        self.index_weighted = np.zeros((49, 49))
+        self._last = None
+
+    @classmethod
+    def from_history(cls, history):
+        """Construcción vectorizada como producto de one-hots."""
+        counts = cls()
+        balls = history.balls
+        counts.n = len(balls)
+        if counts.n:
+            counts._last = balls[-1].astype(np.intp) - 1
+        if counts.n >= 2:
+            onehot = np.zeros((counts.n, 49))
+            onehot[np.arange(counts.n)[:, None], balls.astype(np.intp) - 1] = 1.0
+            prev, nxt = onehot[:-1], onehot[1:]
+            counts.unweighted = prev.T @ nxt
+            counts.index_weighted = (prev * np.arange(counts.n - 1)[:, None]).T @ nxt
+        return counts
+
+    def append(self, balls):
+        """Añade un sorteo: una transición (último → nuevo) en O(36)."""
+        new = np.asarray(balls, dtype=np.intp) - 1
+        if self._last is not None:
+            cells = np.ix_(self._last, new)
+            self.unweighted[cells] += 1.0
+            self.index_weighted[cells] += self.n - 1
+        self._last = new
+        self.n += 1
+
+    def extend(self, history, start):
+        balls = history.balls
+        for i in range(start, len(history)):
+            self.append(balls[i])
+
+    def copy(self):
+        other = TransitionCounts()
+        other.n = self.n
+        other.unweighted = self.unweighted.copy()
+        other.index_weighted = self.index_weighted.copy()
+        other._last = self._last
+        return other
+
+    def matrix(self):
+        """Matriz ponderada por recencia (sin normalizar)."""
+        if self.n == 0:
+            return self.unweighted.copy()
+        return self.unweighted + (2.0 / self.n) * self.index_weighted
+
+
+class TupleTransitions:
+    """
+    Markov de orden superior disperso: contexto = k-tupla de bolas (k=2 pares, k=3 tríos)
+    del sorteo anterior → bola del siguiente sorteo. Se guarda como dict-of-arrays
+    {clave de la tupla: conteos (49,) float32}, así que la memoria está acotada por los
+    contextos realmente vistos (≤ C(49, k)) y añadir un sorteo cuesta O(C(6, k) · 6).
+    """
+
+    BUILD_CHUNK = 20000  # transiciones por bloque en la construcción vectorizada
+
+    def __init__(self, order=2):
+        if order not in (2, 3):
+            raise ValueError("order debe ser 2 (pares) o 3 (tríos)")
+        self.order = order
+        self.n = 0
+        self.counts = {}
+        self._last = None
+        self._subsets = np.array(list(combinations(range(6), order)), dtype=np.intp)
+        self._radix = 49 ** np.arange(order - 1, -1, -1, dtype=np.int64)
+
+    def context_keys(self, balls):
+        """Claves int64 de las k-tuplas de uno o varios sorteos (..., 6) → (..., C(6, k))."""
+        b = np.sort(np.asarray(balls, dtype=np.int64) - 1, axis=-1)
+        return b[..., self._subsets] @ self._radix
+
+    @classmethod
+    def from_history(cls, history, order=2):
+        """Construcción vectorizada por bloques (np.unique sobre claves contexto·49 + destino)."""
+        trans = cls(order)
+        balls = history.balls
+        trans.n = len(balls)
+        if trans.n:
+            trans._last = balls[-1].copy()
+        keys = np.zeros(0, dtype=np.int64)
+        cnt = np.zeros(0, dtype=np.int64)
+        for start in range(0, max(trans.n - 1, 0), cls.BUILD_CHUNK):
+            stop = min(start + cls.BUILD_CHUNK, trans.n - 1)
+            ctx = trans.context_keys(balls[start:stop])
+            tgt = balls[start + 1:stop + 1].astype(np.int64) - 1
+            chunk_keys, chunk_cnt = np.unique((ctx[:, :, None] * 49 + tgt[:, None, :]).ravel(), return_counts=True)
+            # Fusionar con lo acumulado: claves únicas (≤ contextos·49) y conteos sumados
+            keys, inverse = np.unique(np.concatenate([keys, chunk_keys]), return_inverse=True)
+            cnt = np.bincount(inverse, weights=np.concatenate([cnt, chunk_cnt]), minlength=len(keys)).astype(np.int64)
+
+        ctx_u, first = np.unique(keys // 49, return_index=True)
+        bounds = np.append(first, len(keys))
+        targets = keys % 49
+        for j, key in enumerate(ctx_u.tolist()):
+            row = np.zeros(49, dtype=np.float32)
+            row[targets[bounds[j]:bounds[j + 1]]] = cnt[bounds[j]:bounds[j + 1]]
+            trans.counts[key] = row
+        return trans
+
+    def append(self, balls):
+        """Añade un sorteo: transiciones desde las k-tuplas del sorteo anterior."""
+        balls = np.asarray(balls)
+        if self._last is not None:
+            tgt = balls.astype(np.intp) - 1
+            for key in self.context_keys(self._last).tolist():
+                row = self.counts.get(key)
+                if row is None:
+                    row = self.counts[key] = np.zeros(49, dtype=np.float32)
+                row[tgt] += 1.0
+        self._last = balls.copy()
+        self.n += 1
+
+    def extend(self, history, start):
+        balls = history.balls
+        for i in range(start, len(history)):
+            self.append(balls[i])
+
+    def copy(self):
+        other = TupleTransitions(self.order)
+        other.n = self.n
+        other.counts = {k: v.copy() for k, v in self.counts.items()}
+        other._last = self._last
+        return other
+
+    def next_scores(self, balls, alpha=0.5):
+        """
+        Suma, sobre las k-tuplas de `balls`, de P(bola | tupla) con suavizado de Laplace
+        (los contextos no vistos aportan la distribución uniforme).
+        """
+        scores = np.zeros(49)
+        for key in self.context_keys(balls).tolist():
+            row = self.counts.get(key)
+            if row is None:
+                scores += 1.0 / 49
+            else:
+                scores += (row + alpha) / (row.sum() + 49 * alpha)
+        return scores
+
+
+class FrequencyIndex:
+    """
+    Sumas prefijas de apariciones: cum[i, b] = veces que salió la bola b+1 en los
+    sorteos [0, i). Cualquier frecuencia de ventana es una resta de dos filas, O(49).
+    Incluye particiones por día de la semana (L/J/S) y el acumulado del reintegro.
+    """
+
+    def __init__(self, balls, r, weekdays):
+        n = len(balls)
+        onehot = np.zeros((n, 49), dtype=np.int32)
+        onehot[np.arange(n)[:, None], balls.astype(np.intp) - 1] = 1
+        self.cum = np.zeros((n + 1, 49), dtype=np.int32)
+        np.cumsum(onehot, axis=0, out=self.cum[1:])
+
+        r_onehot = np.zeros((n, 10), dtype=np.int32)
+        r_onehot[np.arange(n), r.astype(np.intp)] = 1
+        self.r_cum = np.zeros((n + 1, 10), dtype=np.int32)
+        np.cumsum(r_onehot, axis=0, out=self.r_cum[1:])
+
+        # Por día: posiciones de sus sorteos y sumas prefijas sobre esa subsecuencia
+        self.dow_positions = {}
+        self.dow_cum = {}
+        for dow in np.unique(weekdays[weekdays >= 0]).tolist():
+            positions = np.flatnonzero(weekdays == dow)
+            cum = np.zeros((len(positions) + 1, 49), dtype=np.int32)
+            np.cumsum(onehot[positions], axis=0, out=cum[1:])
+            self.dow_positions[dow] = positions
+            self.dow_cum[dow] = cum
+
+    def window(self, start, stop):
+        """Apariciones de cada bola (49,) en los sorteos [start, stop)."""
+        return (self.cum[stop] - self.cum[start]).astype(np.int64)
+
+    def r_window(self, start, stop):
+        """Apariciones de cada reintegro (10,) en los sorteos [start, stop)."""
+        return (self.r_cum[stop] - self.r_cum[start]).astype(np.int64)
+
+    def weekday_count(self, dow, stop):
+        """Número de sorteos de ese día anteriores a `stop`."""
+        positions = self.dow_positions.get(dow)
+        return 0 if positions is None else int(np.searchsorted(positions, stop))
+
+    def weekday_window(self, dow, stop, last=None):
+        """Apariciones (49,) en los últimos `last` sorteos de ese día anteriores a `stop`."""
+        m = self.weekday_count(dow, stop)
+        if m == 0:
+            return np.zeros(49, dtype=np.int64)
+        start = 0 if last is None else max(m - last, 0)
+        cum = self.dow_cum[dow]
+        return (cum[m] - cum[start]).astype(np.int64)
+
+
+class _SharedData:
+    """Arrays base del dataset completo, compartidos por todos sus prefijos."""
+
+    def __init__(self, balls, c, r, fechas):
+        self.balls = _read_only(np.ascontiguousarray(balls, dtype=np.int8))
+        self.masks = _read_only(balls_to_masks(self.balls))
+        self.c = _read_only(np.ascontiguousarray(c, dtype=np.int8))
+        self.r = _read_only(np.ascontiguousarray(r, dtype=np.int8))
+        self.fechas = _read_only(np.ascontiguousarray(fechas, dtype=np.int64))
+        self.has_dates = bool(len(self.fechas)) and bool((self.fechas != _NAT).all())
+        # Acumuladores derivados, avanzados hacia delante a medida que se piden prefijos mayores
+        self.lock = threading.Lock()
+        self.accumulators = {}
+        self.freq_index = None
+
+
+class DrawHistory:
+    """Histórico de sorteos inmutable y compacto (ver docstring del módulo)."""
+
+    def __init__(self, balls, c=None, r=None, fechas=None):
+        balls = np.asarray(balls).reshape(-1, 6)
+        n = len(balls)
+        c = np.zeros(n, dtype=np.int8) if c is None else c
+        r = np.zeros(n, dtype=np.int8) if r is None else r
+        fechas = np.full(n, _NAT, dtype=np.int64) if fechas is None else fechas
+        self._shared = _SharedData(balls, c, r, fechas)
+        self._n = n
+
+    @classmethod
+    def from_dataframe(cls, df):
+        """Construye el histórico desde el DataFrame de cargar_datos (fecha, n1..n6, c, r)."""
+        balls = df[BALL_COLS].to_numpy()
+        c = df['c'].to_numpy() if 'c' in df.columns else None
+        r = df['r'].to_numpy() if 'r' in df.columns else None
+        fechas = None
+        if 'fecha' in df.columns:
+            fechas = pd.to_datetime(df['fecha']).to_numpy().astype('datetime64[ns]').astype(np.int64)
+        return cls(balls, c=c, r=r, fechas=fechas)
+
+    @classmethod
+    def _view(cls, shared, n):
+        view = cls.__new__(cls)
+        view._shared = shared
+        view._n = n
+        return view
+
+    def prefix(self, n):
+        """Vista de los primeros n sorteos (sin copia)."""
+        n = max(0, min(int(n), self._n))
+        return DrawHistory._view(self._shared, n)
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def empty(self):
+        return self._n == 0
+
+    @property
+    def balls(self):
+        return self._shared.balls[:self._n]
+
+    @property
+    def masks(self):
+        return self._shared.masks[:self._n]
+
+    @property
+    def c(self):
+        return self._shared.c[:self._n]
+
+    @property
+    def r(self):
+        return self._shared.r[:self._n]
+
+    @property
+    def fechas(self):
+        return self._shared.fechas[:self._n]
+
+    @property
+    def has_dates(self):
+        return self._shared.has_dates
+
+    def last_draw(self):
+        """Bolas del último sorteo como array int (6,)."""
+        return self.balls[-1].astype(np.int64)
+
+    def weekdays(self):
+        """Día de la semana de cada sorteo (Lunes=0)."""
+        if not self.has_dates:
+            return np.full(self._n, -1, dtype=np.int8)
+        dias = self.fechas // (86400 * 10**9)
+        return ((dias + 3) % 7).astype(np.int8)  # 1970-01-01 fue jueves
+
+    def version(self):
+        """
+        Versión del dataset de este prefijo: (sorteos, crc32 de bolas, reintegros y fechas).
+        Dos históricos con los mismos datos tienen la misma versión aunque sean objetos distintos.
+        """
+        digest = 0
+        for arr in (self.balls, self.r, self.fechas):
+            digest = zlib.crc32(arr.tobytes(), digest)
+        return self._n, digest
+
+    def reintegro_start(self):
+        """Índice del primer sorteo con reintegro fiable (post-2004)."""
+        if not self.has_dates:
+            return min(REINTEGRO_FALLBACK_START, self._n)
+        return int(np.searchsorted(self.fechas, _REINTEGRO_VALID_FROM_NS, side='left'))
+
+    def _accumulated(self, cls, *args, read=None):
+        """
+        Acumulador `cls(*args)` de este prefijo. El acumulador compartido avanza sorteo a
+        sorteo cuando se piden prefijos crecientes (walk-forward), así que cada paso cuesta
+        O(sorteos nuevos) en lugar de recalcular todo el histórico. Devuelve una copia
+        independiente, o `read(acc)` evaluado bajo el lock si se indica.
+        """
+        shared = self._shared
+        key = (cls, args)
+        with shared.lock:
+            acc = shared.accumulators.get(key)
+            if acc is None or acc.n > self._n:
+                acc = cls.from_history(self, *args)
+            else:
+                acc.extend(self, acc.n)
+            shared.accumulators[key] = acc
+            return read(acc) if read is not None else acc.copy()
+
+    def stats(self):
+        """DrawStats (frecuencias, lags, gaps) de este prefijo."""
+        return self._accumulated(DrawStats)
+
+    def transitions(self):
+        """TransitionCounts (Markov de 1er orden) de este prefijo."""
+        return self._accumulated(TransitionCounts)
+
+    def tuple_transition_scores(self, order=2, alpha=0.5):
+        """Scores (49,) del Markov de orden superior para el sorteo siguiente al último de este prefijo."""
+        last = self.balls[-1]
+        return self._accumulated(TupleTransitions, order, read=lambda acc: acc.next_scores(last, alpha))
+
+    def frequency_index(self):
+        """Índice de sumas prefijas del dataset completo (se construye una vez, lo comparten los prefijos)."""
+        shared = self._shared
+        with shared.lock:
+            if shared.freq_index is None:
+                full = DrawHistory._view(shared, len(shared.balls))
+                shared.freq_index = FrequencyIndex(shared.balls, shared.r, full.weekdays())
+            return shared.freq_index
+
+    def frequencies(self, last=None):
+        """Apariciones de cada bola (49,) en los últimos `last` sorteos (todos si es None)."""
+        start = 0 if last is None else max(self._n - last, 0)
+        return self.frequency_index().window(start, self._n)
+
+    def weekday_count(self, dow):
+        """Número de sorteos celebrados en ese día de la semana (Lunes=0)."""
+        return self.frequency_index().weekday_count(dow, self._n)
+
+    def weekday_frequencies(self, dow, last=None):
+        """Apariciones (49,) en los últimos `last` sorteos celebrados en ese día de la semana."""
+        return self.frequency_index().weekday_window(dow, self._n, last)
+
+    def pair_counts(self, last=None):
+        """Co-ocurrencias (49, 49): sorteos en que salieron juntos i y j (últimos `last`); diagonal 0."""
+        start = 0 if last is None else max(self._n - last, 0)
+        onehot = balls_to_onehot(self.balls[start:])
+        counts = (onehot.T @ onehot).astype(np.int64)
+        np.fill_diagonal(counts, 0)
+        return counts
+
+    def reintegro_frequencies(self, last=None):
+        """Apariciones de cada reintegro (10,) entre los sorteos con reintegro fiable."""
+        start = self.reintegro_start()
+        if last is not None:
+            start = max(start, self._n - last)
+        return self.frequency_index().r_window(start, self._n)
+
+    def to_dataframe(self):
+        """Reconstruye el DataFrame tabular (fecha, n1..n6, c, r)."""
+        cols = {}
+        if self.has_dates:
+            cols['fecha'] = self.fechas.view('datetime64[ns]')
+        for i, col in enumerate(BALL_COLS):
+            cols[col] = self.balls[:, i].astype(np.int64)
+        cols['c'] = self.c.astype(np.int64)
+        cols['r'] = self.r.astype(np.int64)
+        return pd.DataFrame(cols)
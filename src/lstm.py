@@ -0,0 +1,473 @@
+# src/lstm.py
+"""
+Pipeline del BiLSTM de engine_lstm_engineer: features por sorteo, ventanas de
+entrenamiento, modelo y predicción.
+
+Cada sorteo se codifica una sola vez como una fila float32 de 56 dims: one-hot de
+las 49 bolas + 7 meta-features (suma, pares, altos, rango y reparto por tercios).
+Las ventanas de `lookback` sorteos no se materializan: `training_windows` devuelve
+vistas de `sliding_window_view` sobre la matriz de features, y el entrenamiento
+copia solo el lote en curso (`window_sequence`). Con 4.000 sorteos la matriz ocupa
+~0,9 MB, frente a los ~106 MB del tensor float64 (N-60, 60, 56) con cada sorteo
+copiado 60 veces.
+
+La matriz de features se guarda además en disco (data/cache/lstm_features.f32, float32
+sin cabecera) con un sello de versión (sorteos + crc32 del histórico, ver
+DrawHistory.version). train_cron.py la amplía con los sorteos nuevos; el entrenamiento
+la abre con mmap sin copiarla y la inferencia solo lee las últimas `lookback` filas.
+
+Tras cada actualización de datos, `update_model` ajusta el modelo guardado en lugar de
+reentrenarlo: unas pocas épocas sobre las ventanas más recientes más una muestra de
+repaso de las antiguas. El reentrenamiento completo solo se hace según calendario
+(FULL_RETRAIN_DAYS) o si la pérdida sobre los sorteos nuevos, medida antes de
+entrenar con ellos, deriva respecto a la validación del último entrenamiento completo.
+models/lotto_lstm.json guarda la versión de datos con la que se entrenó el modelo.
+
+TensorFlow se importa la primera vez que se usa el LSTM (importar este módulo no lo
+carga) y el modelo entrenado queda residente en el proceso, con su predict compilado
+con tf.function, hasta que cambia el mtime de models/lotto_lstm.keras. Cada vez que se
+guarda el modelo se exportan además sus pesos para la inferencia en NumPy puro
+(src/lstm_numpy.py), que es la que se usa cuando solo hace falta predecir.
+"""
+import importlib.util
+import json
+import os
+import threading
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from src.lstm_numpy import PARITY_TOL, NUMPY_MODEL_PATH, export_numpy_model, parity_error
+
+# TensorFlow es opcional y pesado: aquí solo se comprueba que está instalado
+TF_AVAILABLE = importlib.util.find_spec('tensorflow') is not None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_PATH = os.path.join(BASE_DIR, 'models', 'lotto_lstm.keras')
+MODEL_META_PATH = os.path.join(BASE_DIR, 'models', 'lotto_lstm.json')
+FEATURES_PATH = os.path.join(BASE_DIR, 'data', 'cache', 'lstm_features.f32')
+FEATURES_STAMP_PATH = os.path.join(BASE_DIR, 'data', 'cache', 'lstm_features.json')
+
+LOOKBACK = 60
+N_META = 7
+FEATURE_DIM = 49 + N_META
+
+EPOCHS = 80
+BATCH_SIZE = 32
+VALIDATION_SPLIT = 0.1
+
+# Fine-tuning incremental
+FINETUNE_EPOCHS = 3
+FINETUNE_LR = 1e-4
+FINETUNE_MIN_RECENT = 128      # Ventanas recientes mínimas por ajuste (aunque haya menos sorteos nuevos)
+REPLAY_SIZE = 1024             # Ventanas antiguas de repaso (evita olvidar el histórico)
+FULL_RETRAIN_DAYS = 28
+DRIFT_TOLERANCE = 0.05         # Deriva: pérdida reciente > val_loss · (1 + tolerancia)
+DRIFT_MIN_WINDOWS = 20         # Ventanas nuevas evaluadas antes de decidir si hay deriva
+
+# Cambiar si cambia la definición de draw_features (invalida el almacén en disco)
+FEATURES_SCHEMA = 1
+
+_store_lock = threading.Lock()
+_model_lock = threading.Lock()
+_resident = {}
+
+
+@lru_cache(maxsize=None)
+def _tf():
+    """Importa TensorFlow (una vez por proceso, en el primer uso del LSTM)."""
+    import tensorflow as tf
+    return tf
+
+
+def draw_features(balls):
+    """
+    Features float32 (N, 56) de los sorteos `balls` (N, 6): one-hot (49) + suma,
+    ratio de pares, ratio de altos (> 24), rango y reparto por tercios (≤16, 17-33, ≥34).
+    """
+    balls = np.asarray(balls, dtype=np.int64).reshape(-1, 6)
+    features = np.zeros((len(balls), FEATURE_DIM), dtype=np.float32)
+    np.put_along_axis(features, balls - 1, 1.0, axis=1)
+
+    meta = features[:, 49:]
+    meta[:, 0] = balls.sum(axis=1) / 294.0  # Normalizado (máx teórico: 44+45+46+47+48+49=279, usamos 294)
+    meta[:, 1] = (balls % 2 == 0).sum(axis=1) / 6.0
+    meta[:, 2] = (balls > 24).sum(axis=1) / 6.0
+    meta[:, 3] = (balls.max(axis=1) - balls.min(axis=1)) / 48.0
+    meta[:, 4] = (balls <= 16).sum(axis=1) / 6.0
+    meta[:, 5] = ((balls >= 17) & (balls <= 33)).sum(axis=1) / 6.0
+    meta[:, 6] = (balls >= 34).sum(axis=1) / 6.0
+    return features
+
+
+def _read_stamp():
+    """Sello del almacén de features ({'n', 'digest'}) o None si no existe o es de otro esquema."""
+    try:
+        with open(FEATURES_STAMP_PATH) as f:
+            stamp = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if stamp.get('schema') != FEATURES_SCHEMA or stamp.get('dim') != FEATURE_DIM:
+        return None
+    expected = int(stamp['n']) * FEATURE_DIM * 4
+    if not os.path.exists(FEATURES_PATH) or os.path.getsize(FEATURES_PATH) < expected:
+        return None
+    return stamp
+
+
+def _write_stamp(version):
+    n, digest = version
+    tmp = f"{FEATURES_STAMP_PATH}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump({'schema': FEATURES_SCHEMA, 'dim': FEATURE_DIM, 'n': n, 'digest': digest}, f)
+    os.replace(tmp, FEATURES_STAMP_PATH)
+
+
+def update_feature_store(history):
+    """
+    Pone el almacén de features al día con `history`. Si el almacén es un prefijo del
+    histórico solo se añaden las filas nuevas; si no (otro dataset, datos corregidos),
+    se reescribe entero. Devuelve el número de filas escritas.
+    """
+    with _store_lock:
+        stamp = _read_stamp()
+        n = stamp['n'] if stamp else 0
+        if stamp and n <= len(history) and history.prefix(n).version() == (n, stamp['digest']):
+            if n == len(history):
+                return 0
+            rows = draw_features(history.balls[n:])
+            with open(FEATURES_PATH, 'r+b') as f:
+                f.truncate(n * FEATURE_DIM * 4)  # Descarta restos de un append interrumpido
+                f.seek(0, os.SEEK_END)
+                f.write(rows.tobytes())
+        else:
+            rows = draw_features(history.balls)
+            os.makedirs(os.path.dirname(FEATURES_PATH), exist_ok=True)
+            tmp = f"{FEATURES_PATH}.{os.getpid()}.tmp"
+            rows.tofile(tmp)
+            os.replace(tmp, FEATURES_PATH)
+        _write_stamp(history.version())
+        return len(rows)
+
+
+def _mapped_features(n):
+    return np.memmap(FEATURES_PATH, dtype=np.float32, mode='r', shape=(n, FEATURE_DIM))
+
+
+def feature_matrix(history):
+    """
+    Features (N, 56) de `history` abiertas con mmap desde el almacén (que se actualiza
+    si hace falta). Sin disco escribible se calculan en memoria.
+    """
+    if not len(history):
+        return draw_features(history.balls)
+    try:
+        update_feature_store(history)
+        return _mapped_features(len(history))
+    except OSError:
+        return draw_features(history.balls)
+
+
+def feature_window(history, lookback=LOOKBACK):
+    """Últimas `lookback` filas de features: del almacén si está al día, si no solo se calculan esas."""
+    stamp = _read_stamp()
+    if stamp and (stamp['n'], stamp['digest']) == history.version() and stamp['n'] >= lookback:
+        try:
+            return np.array(_mapped_features(stamp['n'])[-lookback:])
+        except (OSError, ValueError):
+            pass
+    return draw_features(history.balls[-lookback:])
+
+
+def training_windows(features, lookback=LOOKBACK):
+    """
+    (X, y) sin copias: X (N-lookback, lookback, 56) es una vista de ventanas deslizantes
+    sobre `features` y y (N-lookback, 49) el one-hot del sorteo siguiente a cada ventana.
+    """
+    # sliding_window_view pone la ventana en el último eje: (N-lookback+1, 56, lookback)
+    windows = sliding_window_view(features, lookback, axis=0).transpose(0, 2, 1)
+    return windows[:-1], features[lookback:, :49]
+
+
+@lru_cache(maxsize=None)
+def _window_sequence_class():
+    tf = _tf()
+
+    class WindowSequence(tf.keras.utils.Sequence):
+        def __init__(self, X, y, indices, batch_size, shuffle, seed):
+            super().__init__()
+            self.X, self.y = X, y
+            self.batch_size = batch_size
+            self.shuffle = shuffle
+            self.rng = np.random.default_rng(seed)
+            self.order = np.arange(len(X)) if indices is None else np.array(indices)
+            self.on_epoch_end()
+
+        def __len__(self):
+            return -(-len(self.order) // self.batch_size)
+
+        def __getitem__(self, i):
+            idx = self.order[i * self.batch_size:(i + 1) * self.batch_size]
+            return np.ascontiguousarray(self.X[idx]), np.ascontiguousarray(self.y[idx])
+
+        def on_epoch_end(self):
+            if self.shuffle:
+                self.rng.shuffle(self.order)
+
+    return WindowSequence
+
+
+def window_sequence(X, y, indices=None, batch_size=BATCH_SIZE, shuffle=True, seed=None):
+    """
+    Lotes de ventanas (keras Sequence) para model.fit: cada lote se copia de la vista
+    de training_windows al pedirlo (solo las ventanas `indices`, todas por defecto),
+    barajando las muestras en cada época.
+    """
+    return _window_sequence_class()(X, y, indices, batch_size, shuffle, seed)
+
+
+def build_model(lookback=LOOKBACK, feature_dim=FEATURE_DIM):
+    """BiLSTM profundo (128 → 64) con cabeza densa y salida sigmoide por bola."""
+    keras = _tf().keras
+    Sequential, Adam = keras.models.Sequential, keras.optimizers.Adam
+    LSTM, Dense, Dropout = keras.layers.LSTM, keras.layers.Dense, keras.layers.Dropout
+    Bidirectional, BatchNormalization = keras.layers.Bidirectional, keras.layers.BatchNormalization
+    model = Sequential([
+        Bidirectional(LSTM(128, return_sequences=True), input_shape=(lookback, feature_dim)),
+        Dropout(0.25),
+        BatchNormalization(),
+        Bidirectional(LSTM(64, return_sequences=False)),
+        Dropout(0.25),
+        Dense(128, activation='relu'),
+        Dropout(0.15),
+        Dense(64, activation='relu'),
+        Dense(49, activation='sigmoid')
+    ])
+    optimizer = Adam(learning_rate=0.001)
+    model.compile(optimizer=optimizer, loss='binary_crossentropy')
+    return model
+
+
+def load_trained_model(lookback=LOOKBACK, feature_dim=FEATURE_DIM):
+    """Modelo guardado en MODEL_PATH, o None si no existe o su entrada no coincide."""
+    if not os.path.exists(MODEL_PATH):
+        return None
+    try:
+        model = _tf().keras.models.load_model(MODEL_PATH)
+    except Exception:
+        return None
+    # Verificar que la forma de entrada coincide
+    if model.input_shape[1:] != (lookback, feature_dim):
+        return None  # Modelo incompatible, reentrenar
+    return model
+
+
+def _compiled_predict(model, lookback, feature_dim):
+    """Forward pass de inferencia compilado (un solo trazado para cualquier tamaño de lote)."""
+    tf = _tf()
+    return tf.function(lambda x: model(x, training=False),
+                       input_signature=[tf.TensorSpec((None, lookback, feature_dim), tf.float32)])
+
+
+def _remember(model, lookback, feature_dim):
+    """Deja `model`, recién guardado en MODEL_PATH, como modelo residente del proceso."""
+    with _model_lock:
+        _resident.clear()
+        _resident.update(key=(os.path.getmtime(MODEL_PATH), lookback, feature_dim), model=model,
+                         predict=_compiled_predict(model, lookback, feature_dim))
+
+
+def resident_model(lookback=LOOKBACK, feature_dim=FEATURE_DIM):
+    """
+    (modelo, predict compilado) residentes en el proceso. Se cargan de MODEL_PATH la
+    primera vez y se recargan si cambia su mtime. None si no hay modelo válido.
+    """
+    try:
+        key = (os.path.getmtime(MODEL_PATH), lookback, feature_dim)
+    except OSError:
+        return None
+    with _model_lock:
+        if _resident.get('key') != key:
+            model = load_trained_model(lookback, feature_dim)
+            if model is None:
+                return None
+            _resident.clear()
+            _resident.update(key=key, model=model,
+                             predict=_compiled_predict(model, lookback, feature_dim))
+        return _resident['model'], _resident['predict']
+
+
+def read_model_meta():
+    """Metadatos del modelo guardado (versión de datos, fechas, pérdidas) o None."""
+    try:
+        with open(MODEL_META_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_model_meta(meta):
+    tmp = f"{MODEL_META_PATH}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, MODEL_META_PATH)
+
+
+def _save(model, meta):
+    os.makedirs(os.path.dirname(MODEL_PATH), exist_ok=True)
+    model.save(MODEL_PATH)
+    _write_model_meta(meta)
+    _remember(model, meta['lookback'], model.input_shape[-1])
+    try:
+        export_numpy_model(model, os.path.getmtime(MODEL_PATH))
+    except ValueError:
+        pass  # Arquitectura no exportable: el artefacto queda desfasado y se usa Keras
+
+
+def train_model(features, lookback=LOOKBACK, version=None):
+    """
+    Entrena un BiLSTM nuevo sobre las ventanas de `features` y lo guarda en MODEL_PATH,
+    con la versión de datos `version` (DrawHistory.version) en MODEL_META_PATH.
+    Como con validation_split, la validación es el último 10% de las ventanas.
+    """
+    X, y = training_windows(features, lookback)
+    n_val = int(len(X) * VALIDATION_SPLIT)
+    n_train = len(X) - n_val
+    train = window_sequence(X[:n_train], y[:n_train])
+    val = window_sequence(X[n_train:], y[n_train:], shuffle=False) if n_val else None
+
+    model = build_model(lookback, features.shape[1])
+    callbacks = _tf().keras.callbacks
+    early_stop = callbacks.EarlyStopping(patience=7, restore_best_weights=True, monitor='val_loss')
+    lr_scheduler = callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=3, min_lr=1e-6)
+    history = model.fit(
+        train,
+        epochs=EPOCHS,
+        verbose=0,
+        validation_data=val,
+        callbacks=[early_stop, lr_scheduler] if val is not None else []
+    ).history
+
+    now = datetime.now().isoformat(timespec='seconds')
+    n, digest = version if version is not None else (len(features), None)
+    _save(model, {
+        'n': n, 'digest': digest, 'lookback': lookback,
+        'trained_at': now, 'full_trained_at': now, 'mode': 'full',
+        'val_loss': float(min(history['val_loss'] if val is not None else history['loss'])),
+        'recent_loss_sum': 0.0, 'recent_windows': 0,
+    })
+    return model
+
+
+def _new_windows(since, n_windows, lookback):
+    """Índices de las ventanas que predicen sorteos ≥ since (la ventana i predice el i + lookback)."""
+    return np.arange(max(since - lookback, 0), n_windows)
+
+
+def recent_loss(model, features, since, lookback=LOOKBACK):
+    """Pérdida media del modelo sobre las ventanas de los sorteos [since, N) y cuántas son."""
+    X, y = training_windows(features, lookback)
+    new = _new_windows(since, len(X), lookback)
+    if not len(new):
+        return 0.0, 0
+    return float(model.evaluate(window_sequence(X, y, new, shuffle=False), verbose=0)), len(new)
+
+
+def fine_tune_model(model, features, since, lookback=LOOKBACK, seed=None):
+    """
+    Entrena FINETUNE_EPOCHS épocas, con learning rate bajo, sobre las ventanas de los
+    sorteos [since, N) (al menos las FINETUNE_MIN_RECENT últimas) más REPLAY_SIZE
+    ventanas antiguas al azar.
+    """
+    X, y = training_windows(features, lookback)
+    new = _new_windows(since, len(X), lookback)
+    first_recent = max(min(new[0] if len(new) else len(X), len(X) - FINETUNE_MIN_RECENT), 0)
+    rng = np.random.default_rng(seed)
+    replay = rng.choice(first_recent, size=min(REPLAY_SIZE, first_recent), replace=False)
+    indices = np.concatenate([np.arange(first_recent, len(X)), replay])
+
+    model.optimizer.learning_rate.assign(FINETUNE_LR)
+    model.fit(window_sequence(X, y, indices, seed=seed), epochs=FINETUNE_EPOCHS, verbose=0)
+    return model
+
+
+def _retrain_reason(history, meta, lookback, now):
+    """Motivo para reentrenar de cero por datos o calendario (None si puede bastar el fine-tuning)."""
+    if meta is None or meta.get('lookback') != lookback or meta.get('digest') is None:
+        return 'sin metadatos'
+    n = meta['n']
+    if n > len(history) or history.prefix(n).version() != (n, meta['digest']):
+        return 'datos distintos a los del entrenamiento'
+    if (now - datetime.fromisoformat(meta['full_trained_at'])).days >= FULL_RETRAIN_DAYS:
+        return 'programado'
+    return None
+
+
+def _drift_reason(meta):
+    """Deriva: pérdida media de los sorteos nuevos (antes de ver cada uno) frente a la validación."""
+    windows = meta.get('recent_windows', 0)
+    if windows < DRIFT_MIN_WINDOWS:
+        return None
+    loss = meta['recent_loss_sum'] / windows
+    if loss > meta['val_loss'] * (1 + DRIFT_TOLERANCE):
+        return f"deriva (pérdida reciente {loss:.4f} vs val {meta['val_loss']:.4f})"
+    return None
+
+
+def update_model(history, lookback=LOOKBACK, now=None):
+    """
+    Pone el modelo guardado al día con `history` (lo que hace train_cron.py tras cada
+    actualización): fine-tuning con los sorteos nuevos, o entrenamiento completo si no
+    hay modelo, los datos no son una extensión de los del entrenamiento, toca por
+    calendario o hay deriva. Devuelve (modelo, modo, motivo).
+    """
+    now = now or datetime.now()
+    features = feature_matrix(history)
+    meta = read_model_meta()
+    model = load_trained_model(lookback, features.shape[1])
+    reason = 'sin modelo' if model is None else _retrain_reason(history, meta, lookback, now)
+    if reason is None and meta['n'] == len(history):
+        return model, 'al día', None
+
+    if reason is None:
+        # Los sorteos nuevos se evalúan antes de entrenar con ellos: pérdida fuera de muestra
+        loss, windows = recent_loss(model, features, meta['n'], lookback)
+        meta = dict(meta, recent_loss_sum=meta.get('recent_loss_sum', 0.0) + loss * windows,
+                    recent_windows=meta.get('recent_windows', 0) + windows)
+        reason = _drift_reason(meta)
+    if reason is not None:
+        return train_model(features, lookback, history.version()), 'full', reason
+
+    fine_tune_model(model, features, meta['n'], lookback)
+    n, digest = history.version()
+    _save(model, dict(meta, n=n, digest=digest, mode='finetune',
+                      trained_at=now.isoformat(timespec='seconds')))
+    return model, 'finetune', None
+
+
+def predict_next(predict, window):
+    """Probabilidad por bola (49,) del sorteo siguiente a `window` (lookback, 56), con el predict compilado."""
+    x = np.ascontiguousarray(window, dtype=np.float32)[None]
+    return predict(x).numpy()[0]
+
+
+def verify_numpy_export(model, features, lookback=LOOKBACK, n_windows=32):
+    """
+    Paridad Keras / NumPy sobre las últimas `n_windows` ventanas. Si la diferencia supera
+    PARITY_TOL se borra el artefacto (la inferencia vuelve a Keras). Devuelve el error máximo,
+    o None si el modelo no es exportable.
+    """
+    if not os.path.exists(NUMPY_MODEL_PATH):
+        # Borrado tras un fallo de paridad anterior (o nunca exportado): se reexporta del
+        # modelo en memoria, que es el guardado en MODEL_PATH
+        try:
+            export_numpy_model(model, os.path.getmtime(MODEL_PATH))
+        except ValueError:
+            return None
+    X, _ = training_windows(features, lookback)
+    error = parity_error(model, np.ascontiguousarray(X[-n_windows:]))
+    if error > PARITY_TOL and os.path.exists(NUMPY_MODEL_PATH):
+        os.remove(NUMPY_MODEL_PATH)
+    return error
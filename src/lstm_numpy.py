@@ -0,0 +1,173 @@
+# src/lstm_numpy.py
+"""
+Inferencia del BiLSTM en NumPy puro, a partir de los pesos exportados del modelo Keras.
+
+Servir una predicción del LSTM es un único forward pass sobre una entrada (1, 60, 56):
+no hace falta TensorFlow. Al guardar el modelo (src/lstm.py) se exportan sus pesos a
+models/lotto_lstm.npz, junto con el mtime del .keras del que salen, y
+engine_lstm_engineer usa este forward siempre que el artefacto esté al día.
+
+Semántica de Keras reproducida:
+- LSTM: puertas en el orden i, f, c, o (kernel (D, 4u), recurrent_kernel (u, 4u),
+  bias (4u)); activación tanh y recurrente sigmoide.
+- Bidirectional (concat): la capa hacia atrás recorre la secuencia invertida; con
+  return_sequences su salida se reordena en el tiempo, sin él es su último estado.
+- BatchNormalization en inferencia con las medias y varianzas móviles (eps 1e-3).
+- Dropout no actúa en inferencia.
+"""
+import os
+import threading
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NUMPY_MODEL_PATH = os.path.join(BASE_DIR, 'models', 'lotto_lstm.npz')
+
+# Diferencia máxima admitida frente a Keras en la comprobación de paridad
+PARITY_TOL = 1e-4
+
+_ACTIVATIONS = {
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': lambda x: 0.5 * (1.0 + np.tanh(0.5 * x)),  # Estable para |x| grandes
+    'tanh': np.tanh,
+    'linear': lambda x: x,
+}
+_sigmoid = _ACTIVATIONS['sigmoid']
+
+_numpy_lock = threading.Lock()
+_numpy_resident = {}
+
+
+def _lstm(x, kernel, recurrent, bias, reverse=False):
+    """
+    LSTM sobre x (B, T, D). Devuelve (salidas (B, T, u) en el orden temporal original,
+    último estado h (B, u)).
+    """
+    batch, steps, _ = x.shape
+    units = recurrent.shape[0]
+    xw = x @ kernel + bias  # Proyección de la entrada de todos los pasos de una vez
+    h = np.zeros((batch, units), dtype=x.dtype)
+    c = np.zeros((batch, units), dtype=x.dtype)
+    out = np.empty((batch, steps, units), dtype=x.dtype)
+    for t in (range(steps - 1, -1, -1) if reverse else range(steps)):
+        z = xw[:, t] + h @ recurrent
+        i = _sigmoid(z[:, :units])
+        f = _sigmoid(z[:, units:2 * units])
+        g = np.tanh(z[:, 2 * units:3 * units])
+        o = _sigmoid(z[:, 3 * units:])
+        c = f * c + i * g
+        h = o * np.tanh(c)
+        out[:, t] = h
+    return out, h
+
+
+class NumpyBiLSTM:
+    """Forward pass del modelo exportado: lista de capas ('bilstm', 'batchnorm', 'dense')."""
+
+    def __init__(self, layers, arrays):
+        self.layers = layers
+        self.arrays = arrays
+
+    @classmethod
+    def load(cls, path=NUMPY_MODEL_PATH):
+        with np.load(path) as store:
+            arrays = {k: store[k] for k in store.files}
+        layers = [tuple(spec.split(':')) for spec in arrays.pop('layers').tolist()]
+        return cls(layers, arrays)
+
+    def predict(self, x):
+        """Salida (B, 49) para x (B, lookback, 56)."""
+        x = np.asarray(x, dtype=np.float32)
+        w = self.arrays
+        for i, (kind, arg) in enumerate(self.layers):
+            if kind == 'bilstm':
+                fw_out, fw_h = _lstm(x, w[f'{i}_fw_kernel'], w[f'{i}_fw_recurrent'], w[f'{i}_fw_bias'])
+                bw_out, bw_h = _lstm(x, w[f'{i}_bw_kernel'], w[f'{i}_bw_recurrent'], w[f'{i}_bw_bias'],
+                                     reverse=True)
+                if arg == 'sequences':
+                    x = np.concatenate([fw_out, bw_out], axis=-1)
+                else:
+                    x = np.concatenate([fw_h, bw_h], axis=-1)
+            elif kind == 'batchnorm':
+                scale = w[f'{i}_gamma'] / np.sqrt(w[f'{i}_var'] + w[f'{i}_eps'])
+                x = (x - w[f'{i}_mean']) * scale + w[f'{i}_beta']
+            elif kind == 'dense':
+                x = _ACTIVATIONS[arg](x @ w[f'{i}_kernel'] + w[f'{i}_bias'])
+        return x
+
+
+def export_numpy_model(model, source_mtime, path=NUMPY_MODEL_PATH):
+    """
+    Exporta los pesos del modelo Keras a `path` (npz) para NumpyBiLSTM. `source_mtime`
+    es el mtime del .keras guardado: identifica de qué modelo sale el artefacto.
+    """
+    arrays = {}
+    layers = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        i = len(layers)
+        if kind == 'Dropout':
+            continue
+        if kind == 'Bidirectional':
+            for direction, sub in (('fw', layer.forward_layer), ('bw', layer.backward_layer)):
+                if (sub.activation.__name__, sub.recurrent_activation.__name__) != ('tanh', 'sigmoid'):
+                    raise ValueError(f"Activaciones LSTM no soportadas en {layer.name}")
+                kernel, recurrent, bias = sub.get_weights()
+                arrays[f'{i}_{direction}_kernel'] = kernel
+                arrays[f'{i}_{direction}_recurrent'] = recurrent
+                arrays[f'{i}_{direction}_bias'] = bias
+            if getattr(layer, 'merge_mode', 'concat') != 'concat':
+                raise ValueError(f"merge_mode no soportado en {layer.name}")
+            layers.append('bilstm:' + ('sequences' if layer.forward_layer.return_sequences else 'last'))
+        elif kind == 'BatchNormalization':
+            gamma, beta, mean, var = layer.get_weights()
+            arrays.update({f'{i}_gamma': gamma, f'{i}_beta': beta, f'{i}_mean': mean,
+                           f'{i}_var': var, f'{i}_eps': np.float32(layer.epsilon)})
+            layers.append('batchnorm:')
+        elif kind == 'Dense':
+            activation = layer.activation.__name__
+            if activation not in _ACTIVATIONS:
+                raise ValueError(f"Activación no soportada en {layer.name}: {activation}")
+            arrays[f'{i}_kernel'], arrays[f'{i}_bias'] = layer.get_weights()
+            layers.append(f'dense:{activation}')
+        else:
+            raise ValueError(f"Capa no soportada para exportar a NumPy: {kind}")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, layers=np.array(layers), source_mtime=np.float64(source_mtime),
+             **{k: np.asarray(v, dtype=np.float32) for k, v in arrays.items()})
+    os.replace(tmp, path)
+
+
+def parity_error(model, x, numpy_model=None):
+    """Máxima diferencia absoluta entre Keras (inferencia) y NumpyBiLSTM sobre x (B, lookback, 56)."""
+    numpy_model = numpy_model or NumpyBiLSTM.load()
+    expected = np.asarray(model(np.asarray(x, dtype=np.float32), training=False))
+    return float(np.abs(expected - numpy_model.predict(x)).max())
+
+
+def resident_numpy_model(keras_path=None, path=NUMPY_MODEL_PATH):
+    """
+    NumpyBiLSTM residente en el proceso (se recarga si cambia el mtime del npz), o None
+    si no hay artefacto o no corresponde al modelo de `keras_path` (si ese fichero existe).
+    """
+    try:
+        key = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _numpy_lock:
+        if _numpy_resident.get('key') != key:
+            try:
+                numpy_model = NumpyBiLSTM.load(path)
+            except (OSError, ValueError, KeyError):
+                return None
+            _numpy_resident.clear()
+            _numpy_resident.update(key=key, model=numpy_model,
+                                   source_mtime=float(numpy_model.arrays.pop('source_mtime')))
+        resident = dict(_numpy_resident)
+    # Un .keras más nuevo que el exportado (reentrenado sin exportar) invalida el artefacto
+    if keras_path is not None and os.path.exists(keras_path):
+        if os.path.getmtime(keras_path) != resident['source_mtime']:
+            return None
+    return resident['model']
@@ -12,7 +12,7 @@ def main():
     print("🧪 INICIANDO VERIFICACIÓN DEL SISTEMA...")
     
     # 1. Test ETL
-    print("\n[1/3] Probando ETL (Extracción de Datos)...")
+    print("\n[1/4] Probando ETL (Extracción de Datos)...")
     try:
         # Check if data exists, if not, try to update minimal
         if not os.path.exists('data/historico.csv'):
@@ -47,7 +47,7 @@ def main():
         df = pd.DataFrame(data)
     
     # 2. Test Engines
-    print("\n[2/3] Probando Motores de Predicción...")
+    print("\n[2/4] Probando Motores de Predicción...")
     try:
         engines = LottoEngines(df)
         
@@ -70,7 +70,29 @@ def main():
         import traceback
         traceback.print_exc()
 
-    print("\n[3/3] Verificación completada.")
+    # 3. Paridad del forward NumPy con Keras (models/lotto_lstm.npz)
+    print("\n[3/4] Probando paridad NumPy/Keras del LSTM...")
+    try:
+        from src.lstm import FEATURE_DIM, LOOKBACK, TF_AVAILABLE, build_model
+        from src.lstm_numpy import PARITY_TOL, NumpyBiLSTM, export_numpy_model, parity_error
+        if not TF_AVAILABLE:
+            print("   ℹ️ TensorFlow no instalado: se omite.")
+        else:
+            import tempfile
+            model = build_model(LOOKBACK, FEATURE_DIM)
+            x = np.random.default_rng(0).random((8, LOOKBACK, FEATURE_DIM), dtype=np.float32)
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'lotto_lstm.npz')
+                export_numpy_model(model, 0.0, path)
+                error = parity_error(model, x, NumpyBiLSTM.load(path))
+            if error <= PARITY_TOL:
+                print(f"   ✅ Paridad OK: error máximo {error:.2e} (tolerancia {PARITY_TOL:.0e})")
+            else:
+                print(f"   ❌ Paridad fuera de tolerancia: {error:.2e} > {PARITY_TOL:.0e}")
+    except Exception as e:
+        print(f"   ❌ Fallo en paridad NumPy/Keras: {e}")
+
+    print("\n[4/4] Verificación completada.")
     print("✅ El núcleo lógico funciona.")
 
 if __name__ == "__main__":